@@ -1,27 +1,57 @@
-from flask import Flask, request, jsonify
-from function import generate_concrete_rule
+import contextlib
+import json
+import logging
+import os
 
-from function import generate_sparql_query
+from flask import Flask, Response, request, jsonify, stream_with_context
+from function import generation_cache, persistent_cache, trace_slots
+
+import metrics
+from batch import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, generate_batch, generate_item
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)  # This enables CORS for all routes
 
+logger = logging.getLogger(__name__)
+
+# Statements per chunk and worker processes used by /generate for large inputs
+app.config.setdefault('MCSK_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+app.config.setdefault('MCSK_WORKERS', DEFAULT_WORKERS)
+# Small batches are generated in the request's thread; asgi.py sends them to the pool as well
+app.config.setdefault('MCSK_INLINE_BATCHES', True)
+
+def _trace_requested() -> bool:
+    # "?trace=1" returns the template and slots extracted for each statement of the request
+    return request.args.get('trace', '').lower() in ('1', 'true', 'yes')
+
+
+def _workers(trace: bool) -> int:
+    # Traces are collected in this process, so a traced request does not fan out
+    return 1 if trace else app.config['MCSK_WORKERS']
+
+
 @app.route('/generate_rule', methods=['POST'])
 def generate_rule():
     # Extract the natural language input from the request
     data = request.json
-    nl_input = data.get('nl_input')
+    nl_input = data.get('nl_input') if isinstance(data, dict) else None
 
     if not nl_input:
         return jsonify({"error": "Missing nl_input"}), 400
 
-    try:
+    trace = _trace_requested()
+    with trace_slots() if trace else contextlib.nullcontext() as records:
         # Generate the concrete rule
-        concrete_rule = generate_concrete_rule(nl_input)
-        return jsonify({"concrete_rule": str(concrete_rule)}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        [item] = generate_batch([nl_input], 1, _workers(trace), app.config['MCSK_INLINE_BATCHES'])
+    if item.error is not None:
+        return jsonify({"error": item.error}), 500
+
+    response = {"concrete_rule": str(item.concrete_rule)}
+    if trace:
+        response['trace'] = records
+    with metrics.stage('serialize'):
+        return jsonify(response), 200
 
 @app.route('/')
 def index():
@@ -31,31 +61,101 @@ def index():
 @app.route('/generate', methods=['POST'])
 def generateCS():
     data = request.get_json()
-    mcsk_inputs = data.get('mcsk_inputs')
+    mcsk_inputs = data.get('mcsk_inputs') if isinstance(data, dict) else None
+
+    if not isinstance(mcsk_inputs, list):
+        return jsonify({"error": "Missing mcsk_inputs"}), 400
+
+    logger.debug("Received %d MCSK inputs", len(mcsk_inputs))
+
+    trace = _trace_requested()
+    with trace_slots() if trace else contextlib.nullcontext() as records:
+        items = generate_batch(mcsk_inputs, app.config['MCSK_BATCH_SIZE'], _workers(trace), app.config['MCSK_INLINE_BATCHES'])
+
+    response = generate_response(items)
+    if trace:
+        response['trace'] = records
+    with metrics.stage('serialize'):
+        return jsonify(response)
 
-    print(mcsk_inputs)
 
+def generate_response(items: list) -> dict:
+    # Body of a /generate response for the BatchItems of a request
     generated_concerete_rule = []
     generated_sparql_query = []
+    errors = []
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for item in items:
+        if item.error is None:
+            if debug:
+                logger.debug("Generated Concrete Rule for '%s': %s", item.mcsk_input, item.concrete_rule)
+                logger.debug("Generated SPARQL Query for '%s':\n%s", item.mcsk_input, item.sparql_query)
+            generated_concerete_rule.append(item.concrete_rule.expression)
+            generated_sparql_query.append(item.sparql_query)
+        else:
+            logger.info("Failed to generate rule for '%s': %s", item.mcsk_input, item.error)
+            errors.append({'index': item.index, 'mcsk_input': item.mcsk_input, 'error': item.error})
+
+    return {
+        'generated_concerete_rule': generated_concerete_rule,
+        'generated_sparql_query': generated_sparql_query,
+        'errors': errors
+    }
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    # Hit/miss/eviction counters of the in-process rule cache, and of the persistent one when enabled
+    stats = generation_cache.stats()
+    if persistent_cache is not None:
+        stats['persistent'] = persistent_cache.stats()
+    return jsonify(stats)
 
-    for mcsk_input in mcsk_inputs:
-        try:
-            cr = generate_concrete_rule(mcsk_input)
-            print(f"Generated Concrete Rule for '{mcsk_input}': {cr}")
-            generated_concerete_rule.append(cr.expression)
 
-            sparql_query = generate_sparql_query(cr)
-            print(f"Generated SPARQL Query for '{mcsk_input}':\n{sparql_query}")
-            generated_sparql_query.append(sparql_query)
+@app.route('/metrics')
+def metrics_endpoint():
+    # Per-stage latency histograms, per-template rule and failure counts, cache counters
+    if not metrics.ENABLED:
+        return Response('metrics are disabled\n', status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
+
+def _read_ndjson(stream):
+    # Yield one MCSK statement (or the error met while decoding it) per non-empty line
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
         except ValueError as e:
-            print(f"Failed to generate rule for '{mcsk_input}': {e}")
-    
-    return jsonify({
-        'generated_concerete_rule': generated_concerete_rule,
-        'generated_sparql_query': generated_sparql_query
-    })
+            yield None, f"Invalid JSON line: {e}"
+            continue
+        if isinstance(value, dict):
+            value = value.get('mcsk_input')
+        yield value, None
+
+
+@app.route('/generate/stream', methods=['POST'])
+def generateCS_stream():
+    # NDJSON in, NDJSON out: every line is answered as soon as its rule and query are ready
+    def generate():
+        for index, (mcsk_input, error) in enumerate(_read_ndjson(request.stream)):
+            if error is None:
+                item = generate_item(index, mcsk_input)
+                error = item.error
+            if error is None:
+                line = {'index': index, 'mcsk_input': mcsk_input,
+                        'concrete_rule': item.concrete_rule.expression, 'sparql_query': item.sparql_query}
+            else:
+                line = {'index': index, 'mcsk_input': mcsk_input, 'error': error}
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 if __name__ == '__main__':
+    # MCSK_LOG_LEVEL=DEBUG logs every extracted slot, generated rule and query
+    logging.basicConfig(level=os.environ.get('MCSK_LOG_LEVEL', 'WARNING').upper())
     app.run(debug=True)
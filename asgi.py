@@ -0,0 +1,116 @@
+"""Production ASGI entry point for the Flask app of App.py.
+
+Run with any ASGI server, e.g.:
+
+    pip install a2wsgi uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+Every route of App.py is served as is, through a WSGI adapter running the
+Flask app on a bounded pool of threads, so both servers share their routes
+and validation. Generation is CPU-bound, so /generate and /generate_rule
+send every batch, however small, to the shared process pool of batch.py
+instead of generating in the request's thread.
+Backpressure: at most MCSK_MAX_CONCURRENCY generation requests run at a
+time and at most MCSK_QUEUE_DEPTH more wait for a slot; further requests
+are answered 503 with a Retry-After header instead of piling up.
+"""
+import asyncio
+import json
+import os
+
+from App import app as flask_app
+from batch import DEFAULT_WORKERS, shutdown_executor
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # uvicorn bundles an older copy of the same adapter
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+MAX_CONCURRENCY = int(os.environ.get("MCSK_MAX_CONCURRENCY", DEFAULT_WORKERS))
+QUEUE_DEPTH = int(os.environ.get("MCSK_QUEUE_DEPTH", 64))
+MAX_BODY_SIZE = int(os.environ.get("MCSK_MAX_BODY_SIZE", 64 * 1024 * 1024))
+
+# Requests that generate rules and count against the limiter
+GENERATION_PATHS = frozenset(("/generate", "/generate_rule", "/generate/stream"))
+# Threads beyond the generation slots, so /metrics and /cache_stats answer while every slot is busy
+_SPARE_THREADS = 2
+
+flask_app.config['MCSK_INLINE_BATCHES'] = False
+flask_app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_SIZE
+_wsgi = WSGIMiddleware(flask_app, workers=MAX_CONCURRENCY + _SPARE_THREADS)
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+#Limiter Class: Bounds the requests being generated and the requests queued behind them.
+class Limiter:
+    def __init__(self, concurrency: int, queue_depth: int):
+        """Initialize the Limiter class.
+
+        Args:
+        concurrency (int): Requests generated at the same time.
+        queue_depth (int): Requests allowed to wait for a free slot.
+        """
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.waiting = 0
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked() and self.waiting >= self.queue_depth:
+            raise _HTTPError(503, "Server busy, retry later")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
+
+
+limiter = Limiter(MAX_CONCURRENCY, QUEUE_DEPTH)
+
+
+async def _send_error(send, error: _HTTPError):
+    body = json.dumps({"error": str(error)}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+               (b"access-control-allow-origin", b"*")]
+    if error.status == 503:
+        headers.append((b"retry-after", b"1"))
+    await send({"type": "http.response.start", "status": error.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            shutdown_executor()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["method"] != "POST" or scope["path"] not in GENERATION_PATHS:
+        return await _wsgi(scope, receive, send)
+    try:
+        async with limiter:
+            await _wsgi(scope, receive, send)
+    except _HTTPError as e:
+        await _send_error(send, e)
@@ -0,0 +1,184 @@
+"""Batched execution of the MCSK -> ConcreteRule -> SPARQL pipeline on a process pool."""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from function import ConcreteRule, GenerationResult, cache_result, cached_result, generate_rule_and_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("MCSK_BATCH_SIZE", 500))
+DEFAULT_WORKERS = int(os.environ.get("MCSK_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+
+#BatchItem Class: Represents the outcome of one MCSK statement of a batch, either a rule and its query or an error.
+class BatchItem:
+    __slots__ = ("index", "mcsk_input", "concrete_rule", "sparql_query", "error")
+
+    def __init__(self, index: int, mcsk_input: str, concrete_rule: ConcreteRule = None, sparql_query: str = None, error: str = None):
+        """Initialize the BatchItem class.
+
+        Args:
+        index (int): Position of the statement in the batch.
+        mcsk_input (str): The MCSK statement.
+        concrete_rule (ConcreteRule): The generated rule, None on failure.
+        sparql_query (str): The generated SPARQL update, None on failure.
+        error (str): Why generation failed, None on success.
+        """
+        self.index = index
+        self.mcsk_input = mcsk_input
+        self.concrete_rule = concrete_rule
+        self.sparql_query = sparql_query
+        self.error = error
+
+
+def generate_item(index: int, mcsk_input: str) -> BatchItem:
+    try:
+        concrete_rule, sparql_query = generate_rule_and_query(mcsk_input)
+        return BatchItem(index, mcsk_input, concrete_rule, sparql_query)
+    except Exception as e:
+        return BatchItem(index, mcsk_input, error=str(e) or type(e).__name__)
+
+
+def _generate_chunk(start: int, chunk: list) -> list:
+    return [generate_item(start + offset, mcsk_input) for offset, mcsk_input in enumerate(chunk)]
+
+
+def _generate_chunk_in_worker(start: int, chunk: list, metrics_enabled: bool):
+    # Metrics recorded in a worker process are shipped back with its results
+    metrics.set_enabled(metrics_enabled)
+    if not metrics_enabled:
+        return _generate_chunk(start, chunk), None
+    metrics.reset()
+    items = _generate_chunk(start, chunk)
+    return items, metrics.snapshot()
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """Return the shared process pool, recreating it when the worker count changes."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # Spawned workers do not inherit the locks of the threaded web server
+            _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    # A pool that lost a worker refuses every later task; the next get_executor() builds a new one
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is executor:
+            _executor.shutdown(wait=False)
+            _executor = _executor_workers = None
+
+
+def _submit(workers: int, start: int, chunk: list) -> tuple:
+    # (executor, future) of a chunk sent to the shared pool
+    executor = get_executor(workers)
+    try:
+        return executor, executor.submit(_generate_chunk_in_worker, start, chunk, metrics.ENABLED)
+    except BrokenProcessPool:
+        # Broken while idle, e.g. a worker was killed between two batches
+        _discard_executor(executor)
+        executor = get_executor(workers)
+        return executor, executor.submit(_generate_chunk_in_worker, start, chunk, metrics.ENABLED)
+
+
+def _chunk_results(executor: ProcessPoolExecutor, start: int, chunk: list, outcome) -> list:
+    # The items a worker returned, or one error per statement of a chunk lost with its worker
+    if isinstance(outcome, BrokenProcessPool):
+        _discard_executor(executor)
+        logger.error("Worker process lost while generating statements %d-%d: %s", start, start + len(chunk) - 1, outcome)
+        return [BatchItem(start + offset, mcsk_input, error=str(outcome)) for offset, mcsk_input in enumerate(chunk)]
+    chunk_results, chunk_metrics = outcome
+    if chunk_metrics is not None:
+        metrics.merge(chunk_metrics)
+    return chunk_results
+
+
+def _split_cached(mcsk_inputs: list) -> tuple:
+    # Statements already in this process's cache are answered before fanning
+    # out, so they cost no IPC and count in this process's cache statistics
+    items = [None] * len(mcsk_inputs)
+    missing = []
+    for index, mcsk_input in enumerate(mcsk_inputs):
+        try:
+            result = cached_result(mcsk_input)
+        except ValueError:
+            result = None  # left to the worker, which reports the error
+        if result is None:
+            missing.append(index)
+        else:
+            items[index] = BatchItem(index, mcsk_input, result.concrete_rule, result.sparql_query)
+    return items, missing
+
+
+def _merge_generated(items: list, missing: list, generated: list) -> list:
+    # Workers number the statements they got; the numbers are mapped back to batch positions
+    for item in generated:
+        item.index = missing[item.index]
+        items[item.index] = item
+        if item.error is None:
+            cache_result(item.mcsk_input, GenerationResult(item.concrete_rule, item.sparql_query))
+    return items
+
+
+def shutdown_executor():
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = _executor_workers = None
+
+
+def generate_batch(mcsk_inputs: list, batch_size: int = None, workers: int = None, inline: bool = True) -> list:
+    """Generate concrete rules and SPARQL queries for a batch of MCSK statements.
+
+    The inputs are split into chunks of ``batch_size`` statements that run on
+    a process pool. Batches that fit in a single chunk (unless ``inline`` is
+    off), or a worker count of 1, run in the calling thread. Statements found in this process's cache
+    are answered without fanning out, and results coming back from the
+    workers are added to it. Results come back in input order, one
+    BatchItem per statement. When a worker process dies, the statements of
+    the chunks lost with it come back as errors and the pool is rebuilt for
+    the next batch.
+
+    Args:
+    mcsk_inputs (list): The MCSK statements.
+    batch_size (int): Number of statements per chunk sent to a worker.
+    workers (int): Number of worker processes.
+    inline (bool): Run small batches in the calling thread; servers that handle requests on threads
+    turn it off, so concurrent requests generate on several cores instead of sharing the GIL.
+    """
+    batch_size = max(1, batch_size or DEFAULT_BATCH_SIZE)
+    workers = max(1, workers or DEFAULT_WORKERS)
+    mcsk_inputs = list(mcsk_inputs)
+
+    if workers == 1 or (inline and len(mcsk_inputs) <= batch_size):
+        return _generate_chunk(0, mcsk_inputs)
+
+    items, missing = _split_cached(mcsk_inputs)
+    pending = [mcsk_inputs[index] for index in missing]
+    starts = range(0, len(pending), batch_size)
+    chunks = [pending[start:start + batch_size] for start in starts]
+    submitted = [_submit(workers, start, chunk) for start, chunk in zip(starts, chunks)]
+    generated = []
+    for start, chunk, (executor, future) in zip(starts, chunks, submitted):
+        try:
+            outcome = future.result()
+        except BrokenProcessPool as e:
+            outcome = e
+        generated.extend(_chunk_results(executor, start, chunk, outcome))
+    return _merge_generated(items, missing, generated)
@@ -0,0 +1,146 @@
+"""Microbenchmark: the original classify-then-rescan path vs. one trigger search whose offsets SpecializeRule reuses.
+
+Usage: python bench_classify.py [corpus_size] [repeat]
+"""
+import sys
+import timeit
+
+from corpus import synthetic_corpus
+from function import (MCSK, RT1, RT2, RT3, RT4, RT5, RT6, RT7, RT8, ConcreteRule, SpecializeRule, RuleTemplate,
+                      classify_statement)
+
+
+# The classifier this benchmark is measured against: one `in` scan per template.
+def baseline_template(statement: str):
+    if "result" in statement:
+        return RT1
+    elif "After" in statement:
+        return RT2
+    elif "involves" in statement:
+        return RT3
+    elif "made of" in statement:
+        return RT4
+    elif "is output of" in statement:
+        return RT5
+    elif "is the input of" in statement:
+        return RT6
+    elif "includes" in statement:
+        return RT7
+    elif "is produced by" in statement:
+        return RT8
+    raise ValueError("Unknown MCSK format!")
+
+
+# The original SpecializeRule, which scans the statement for the triggers a
+# second time and splits it into words; only its debugging prints are left out.
+def baseline_specialize(RT: RuleTemplate, MCSK: MCSK) -> ConcreteRule:
+    words = MCSK.statement.split()
+
+    if "result" in MCSK.statement:
+        words = MCSK.statement.split()
+        process_name = words[3]
+        product_name = ' '.join(words[-3:]).replace('a ', '').replace('an ', '').replace('is ', '').rstrip('.')
+        CR_expression = RT.expression.replace("product(x)", f"{product_name}(x)")
+        CR_expression = CR_expression.replace("process(y)", f"{process_name}(y)")
+        CR_expression = CR_expression.replace("isOutputOf(x, y)", "isOutputOf(x, y)")
+    elif "After" in MCSK.statement:
+        preceding_process = words[1]
+        succeeding_process = words[4]
+        CR_expression = RT.expression.replace("process(x)", f"{preceding_process}(x)")
+        CR_expression = CR_expression.replace("process(y)", f"{succeeding_process}(y)")
+        CR_expression = CR_expression.replace("precedes(y, x)", "precedes(y, x)")
+    else:
+        process_name = words[1]
+        machine_name = ' '.join(words[-2:])
+        machine_name = machine_name.replace('a ', '').replace('an ', '').rstrip('.')
+        CR_expression = RT.expression.replace("process(x)", f"{process_name}(x)")
+        CR_expression = CR_expression.replace("machine(y)", f"{machine_name}(y)")
+        CR_expression = CR_expression.replace("participatesAtSomeTime(y, x)", "participatesAtSomeTime(y, x)")
+
+    if "made of" in MCSK.statement:
+        words = MCSK.statement.split()
+        product_name = words[1]
+        material_name = ' '.join(words[-3:]).replace('is ', '').replace('made of ', '').rstrip('.')
+        CR_expression = RT4.expression.replace("product(x)", f"{product_name}(x)")
+        CR_expression = CR_expression.replace("material(y)", f"{material_name}(y)")
+        CR_expression = CR_expression.replace("ispartOf(y, x)", "ispartOf(y, x)")
+
+    if "is output of" in MCSK.statement:
+        words = MCSK.statement.split()
+        assembly_name = words[0]
+        assembly_process_name = ' '.join(words[-2:]).replace('is ', '').replace('output of ', '').rstrip('.')
+        CR_expression = RT5.expression.replace("assembly(x)", f"{assembly_name}(x)")
+        CR_expression = CR_expression.replace("assemblyProcess(y)", f"{assembly_process_name}(y)")
+        CR_expression = CR_expression.replace("isOutputOf(y, x)", "isOutputOf(x, y)")
+
+    if "is the input of" in MCSK.statement:
+        words = MCSK.statement.split()
+        split_index = words.index("is")
+        assembly_name = ' '.join(words[split_index + 4:]).replace('is ', '').replace('the input of ', '').rstrip('.')
+        component_name = ' '.join(words[:split_index]).rstrip('.')
+        CR_expression = RT6.expression.replace("assembly(x)", f"{assembly_name}(x)")
+        CR_expression = CR_expression.replace("component(y)", f"{component_name}(y)")
+        CR_expression = CR_expression.replace("isInputOf(y, x)", "isInputOf(y, x)")
+
+    if "includes" in MCSK.statement:
+        words = MCSK.statement.split()
+        assembly_name = words[0]
+        process_names = words[2:]
+        process1_name = process_names[0]
+        process2_name = process_names[2]
+        CR_expression = RT7.expression.replace("assembly(x)", f"{assembly_name}(x)")
+        CR_expression = CR_expression.replace("process(y)", f"{process1_name}(y)")
+        CR_expression = CR_expression.replace("process(z)", f"{process2_name}(z)")
+        CR_expression = CR_expression.replace("partOf(y, x)", "partOf(y, x)")
+        CR_expression = CR_expression.replace("partOf(z, x)", "partOf(z, x)")
+
+    if "is produced by" in MCSK.statement:
+        parts = MCSK.statement.split(" and ")
+        component1_part = parts[0].split(" is produced by ")
+        component2_part = parts[1].split(" is produced by ")
+        component1_name = component1_part[0].strip()
+        process1_name = component1_part[1].strip()
+        component2_name = component2_part[0].strip()
+        process2_name = component2_part[1].strip()
+        CR_expression = RT8.expression.replace("component1(x)", f"{component1_name}(x)")
+        CR_expression = CR_expression.replace("component2(y)", f"{component2_name}(y)")
+        CR_expression = CR_expression.replace("process(p1)", f"{process1_name}(p1)")
+        CR_expression = CR_expression.replace("isOutputOf(y, p1)", "isOutputOf(y, p1)")
+        CR_expression = CR_expression.replace("process(p2)", f"{process2_name}(p2)")
+        CR_expression = CR_expression.replace("isOutputOf(x, p2)", "isOutputOf(x, p2)")
+
+    return ConcreteRule(CR_expression, RT.id)
+
+
+def baseline_path(corpus):
+    for statement in corpus:
+        mcsk = MCSK(statement)
+        baseline_specialize(baseline_template(statement), mcsk)
+
+
+def single_pass_path(corpus):
+    # What generate_concrete_rule does, without the metrics stages
+    for statement in corpus:
+        match = classify_statement(statement)
+        SpecializeRule(match.template, MCSK(statement), match)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    corpus = synthetic_corpus(size)
+
+    cases = [
+        ("classify: baseline cascade", lambda: [baseline_template(s) for s in corpus]),
+        ("classify: single search", lambda: [classify_statement(s) for s in corpus]),
+        ("classify+specialize: baseline", lambda: baseline_path(corpus)),
+        ("classify+specialize: single pass", lambda: single_pass_path(corpus)),
+    ]
+    print(f"{size} statements, best of {repeat}")
+    timings = [(name, min(timeit.repeat(case, number=1, repeat=repeat))) for name, case in cases]
+    for name, seconds in timings:
+        print(f"{name:<34} {seconds * 1000:9.1f} ms  {size / seconds:12,.0f} stmt/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark of the forward-chaining engine on synthetic rules and fact sets.
+
+Rules come from a seeded MCSK corpus; the facts are instances of the
+classes the rules match on, spread uniformly over them.
+
+Usage: python bench_engine.py [--rules 1000] [--facts 10000] [--seed 0] [--max-depth 2]
+"""
+import argparse
+import random
+from time import perf_counter
+
+from corpus import synthetic_corpus
+from engine import Engine
+from function import generate_concrete_rule
+
+
+def synthetic_facts(engine: Engine, size: int, seed: int = 0) -> list:
+    """``size`` unary facts over the predicates the loaded rules match on."""
+    predicates = sorted({predicate for rule in engine.rules for predicate, args in rule.body if len(args) == 1})
+    rng = random.Random(seed)
+    return [(predicate, f"i{n}") for n, predicate in enumerate(rng.choices(predicates, k=size))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=1000, help="MCSK statements the rules are generated from")
+    parser.add_argument("--facts", type=int, default=10000, help="initial facts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-depth", type=int, default=2)
+    args = parser.parse_args()
+
+    rules = [generate_concrete_rule(statement) for statement in synthetic_corpus(args.rules, args.seed)]
+    start = perf_counter()
+    engine = Engine(rules, max_depth=args.max_depth)
+    facts = synthetic_facts(engine, args.facts, args.seed)
+    engine.add_facts(facts)
+    loaded = perf_counter() - start
+
+    start = perf_counter()
+    derived = engine.run()
+    seconds = perf_counter() - start
+
+    print(f"{len(engine.rules)} rules, {len(facts)} facts loaded in {loaded:.2f} s")
+    print(f"{derived} facts derived in {seconds:.2f} s ({derived / seconds:,.0f} facts/s), "
+          f"{engine.rounds} rounds, {'fixpoint' if engine.saturated else 'round limit'} reached")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Throughput and tail-latency benchmark of the MCSK generation pipeline.
+
+Measures generate_concrete_rule, generate_sparql_query and the end-to-end
+/generate route (through Flask's test client) on a seeded synthetic corpus,
+and writes the results as JSON so runs can be compared across commits.
+
+Usage: python benchmark.py [--size 10000] [--seed 0] [--mix RT1=2,RT7=1]
+                           [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from time import perf_counter
+
+import metrics
+from corpus import parse_mix, synthetic_corpus
+from function import generate_concrete_rule, generate_sparql_query, generation_cache
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies: list, statements: int, seconds: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "statements": statements,
+        "seconds": seconds,
+        "statements_per_second": statements / seconds if seconds else None,
+        "latency_ms": {
+            "mean": statistics.fmean(ordered) * 1000,
+            "p50": _percentile(ordered, 0.50) * 1000,
+            "p95": _percentile(ordered, 0.95) * 1000,
+            "p99": _percentile(ordered, 0.99) * 1000,
+            "max": ordered[-1] * 1000,
+        },
+    }
+
+
+def bench_concrete_rule(corpus: list) -> dict:
+    latencies = []
+    started = perf_counter()
+    for statement in corpus:
+        start = perf_counter()
+        try:
+            generate_concrete_rule(statement)
+        except ValueError:
+            pass
+        latencies.append(perf_counter() - start)
+    return summarize(latencies, len(corpus), perf_counter() - started)
+
+
+def bench_sparql_query(corpus: list) -> dict:
+    rules = [generate_concrete_rule(statement) for statement in corpus]
+    latencies = []
+    started = perf_counter()
+    for rule in rules:
+        start = perf_counter()
+        generate_sparql_query(rule)
+        latencies.append(perf_counter() - start)
+    return summarize(latencies, len(rules), perf_counter() - started)
+
+
+def bench_generate_route(corpus: list, request_size: int, workers: int) -> dict:
+    # Imported here so the function-level benchmarks run without Flask installed
+    from App import app
+
+    app.config['MCSK_WORKERS'] = workers
+    client = app.test_client()
+    latencies = []
+    started = perf_counter()
+    for start in range(0, len(corpus), request_size):
+        batch = corpus[start:start + request_size]
+        request_start = perf_counter()
+        response = client.post('/generate', json={'mcsk_inputs': batch})
+        if response.status_code != 200:
+            raise RuntimeError(f"/generate answered {response.status_code}")
+        latencies.append(perf_counter() - request_start)
+    result = summarize(latencies, len(corpus), perf_counter() - started)
+    result["request_size"] = request_size
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        # The commit of the code being measured, wherever the benchmark is run from
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict):
+    print(f"\ncompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, result in results["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("statements_per_second"):
+            continue
+        speedup = result["statements_per_second"] / old["statements_per_second"]
+        p99 = result["latency_ms"]["p99"] / old["latency_ms"]["p99"]
+        print(f"  {name:<24} throughput x{speedup:5.2f}   p99 latency x{p99:5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="number of statements (1k to 1M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=None, help='template weights, e.g. "RT1=2,RT7=1"')
+    parser.add_argument("--request-size", type=int, default=100, help="statements per /generate request")
+    parser.add_argument("--workers", type=int, default=1, help="MCSK_WORKERS used by the /generate benchmark")
+    parser.add_argument("--cache", action="store_true", help="keep the rule cache on (it is disabled by default)")
+    parser.add_argument("--no-metrics", action="store_true", help="disable stage instrumentation")
+    parser.add_argument("--skip-route", action="store_true", help="skip the end-to-end /generate benchmark")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    if not args.cache:
+        generation_cache.maxsize = 0
+        # Read by the spawned pool workers when they import function
+        os.environ["MCSK_CACHE_SIZE"] = "0"
+    generation_cache.clear()
+    metrics.set_enabled(not args.no_metrics)
+
+    corpus = synthetic_corpus(args.size, args.seed, args.mix)
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {},
+    }
+    benchmarks = [
+        ("generate_concrete_rule", lambda: bench_concrete_rule(corpus)),
+        ("generate_sparql_query", lambda: bench_sparql_query(corpus)),
+    ]
+    if not args.skip_route:
+        benchmarks.append(("/generate", lambda: bench_generate_route(corpus, args.request_size, args.workers)))
+
+    print(f"{args.size} statements, seed {args.seed}")
+    for name, benchmark in benchmarks:
+        result = benchmark()
+        results["results"][name] = result
+        latency = result["latency_ms"]
+        print(f"  {name:<24} {result['statements_per_second']:12,.0f} stmt/s   "
+              f"p50 {latency['p50']:8.3f} ms   p95 {latency['p95']:8.3f} ms   p99 {latency['p99']:8.3f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Bounded, thread-safe caches for generated rules and queries."""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+#LRUCache Class: A least-recently-used cache with an optional time-to-live, safe to share between threads.
+class LRUCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = None):
+        """Initialize the LRUCache class.
+
+        Args:
+        maxsize (int): Maximum number of entries; the least recently used one is evicted beyond it. 0 disables the cache.
+        ttl (float): Seconds an entry stays valid, None for no expiry.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+#SQLiteCache Class: A persistent, content-addressed cache in a SQLite file shared by processes and restarts.
+class SQLiteCache:
+    def __init__(self, path: str, version: str = "", dumps=json.dumps, loads=json.loads):
+        """Initialize the SQLiteCache class.
+
+        The database runs in WAL mode, so any number of readers proceed while
+        one writer appends. Entries are keyed on a hash of the version and
+        the key, so a version change never serves stale results. Entries of
+        other versions are kept, as processes still running the old version
+        may share the file during a rolling deploy; prune() drops them.
+        Errors reading or writing the database are logged and counted, and
+        the lookup is treated as a miss.
+
+        Args:
+        path (str): Database file, created if missing.
+        version (str): Stamp of whatever the cached values depend on.
+        dumps (callable): Turns a value into the text that is stored.
+        loads (callable): Turns stored text back into a value.
+        """
+        self.path = path
+        self.version = version
+        self._dumps = dumps
+        self._loads = loads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, version TEXT NOT NULL, value TEXT NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections may not be shared between threads, so each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _digest(self, key: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{key}".encode("utf-8")).hexdigest()
+
+    def _failed(self, operation: str, error: Exception):
+        # The cache only saves work, so a locked, full or corrupt database must not fail the caller
+        with self._lock:
+            self.errors += 1
+        logger.warning("Persistent cache %s: %s failed: %s", self.path, operation, error)
+
+    def get(self, key: str, default=None):
+        try:
+            row = self._connection().execute("SELECT value FROM entries WHERE key = ?", (self._digest(key),)).fetchone()
+            value = None if row is None else self._loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            self._failed("get", e)
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        try:
+            with self._connection() as connection:
+                connection.execute("INSERT OR REPLACE INTO entries (key, version, value) VALUES (?, ?, ?)",
+                                   (self._digest(key), self.version, self._dumps(value)))
+        except sqlite3.Error as e:
+            self._failed("put", e)
+
+    def prune(self) -> int:
+        """Drop the entries of other versions and return how many there were."""
+        with self._connection() as connection:
+            return connection.execute("DELETE FROM entries WHERE version != ?", (self.version,)).rowcount
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries")
+        with self._lock:
+            self.hits = self.misses = self.errors = 0
+
+    def stats(self) -> dict:
+        try:
+            size = len(self)
+        except sqlite3.Error as e:
+            self._failed("count", e)
+            size = None
+        with self._lock:
+            return {
+                "path": self.path,
+                "version": self.version,
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+            }
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
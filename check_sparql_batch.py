@@ -0,0 +1,97 @@
+"""Check that the consolidated updates of sparql_batch equal the per-rule updates.
+
+Runs the same rules twice on a seeded rdflib graph, once as one SPARQL
+update per rule in order and once through compile_batch, and compares the
+results. Minted instances get random IRIs, so each one is compared by the
+class and rule key in its IRI prefix and the triples it takes part in.
+Then compile_delete_batch is run on both graphs, which have to come back
+to the seed triples. tests/test_sparql_batch.py makes the same checks
+under pytest.
+
+Usage: python check_sparql_batch.py [--size 200] [--seed 0]
+"""
+import argparse
+import re
+import sys
+from collections import Counter
+
+import rdflib
+
+from corpus import synthetic_corpus
+from function import generate_concrete_rule, generate_sparql_query
+from names import MCSKG_NAMESPACE, class_iri
+from sparql_batch import compile_batch, compile_delete_batch, stratify
+
+# One statement per template, and a rule that reads the class the rule before it writes
+STATEMENTS = [
+    "The result of painting is a painted object",
+    "After painting you should dry",
+    "After dry you should pack",
+    "The drying process involves a dryer machine",
+    "The lego structure is made of lego Blocks",
+    "Lego assembly is output of lego assembly process",
+    "Lego is the input of lego assembly",
+    "Lego assembly includes picking and fixing",
+    "Wheel is produced by casting and Frame is produced by welding",
+]
+
+_MINTED_PATTERN = re.compile(re.escape(MCSKG_NAMESPACE) + r"(.+_[0-9a-f]{16})_[0-9a-f-]{36}\Z")
+
+
+def seed_graph(rules) -> rdflib.Graph:
+    """Two instances of every class the rules name."""
+    graph = rdflib.Graph()
+    for name in sorted({name for rule in rules for name in rule.bindings}):
+        for n in range(2):
+            graph.add((rdflib.URIRef(f"http://example.org/instance/{n}/{name.replace(' ', '_')}"),
+                       rdflib.RDF.type, rdflib.URIRef(class_iri(name))))
+    return graph
+
+
+def canonical(graph: rdflib.Graph) -> Counter:
+    # Minted IRIs differ between runs; they are replaced by the class and rule they were minted for
+    def term(node):
+        minted = _MINTED_PATTERN.match(str(node))
+        return "minted:" + minted.group(1) if minted else str(node)
+    return Counter((term(subject), str(predicate), term(object_)) for subject, predicate, object_ in graph)
+
+
+def check(rules) -> bool:
+    seed = seed_graph(rules)
+
+    sequential = seed_graph(rules)
+    for rule in rules:
+        sequential.update(generate_sparql_query(rule))
+    batched = seed_graph(rules)
+    updates = compile_batch(rules)
+    for update in updates:
+        batched.update(update)
+
+    same = canonical(sequential) == canonical(batched)
+    print(f"{len(rules)} rules, {len(stratify(rules))} strata, {len(updates)} batched updates")
+    print(f"  insert: {len(sequential)} triples per rule, {len(batched)} batched -> {'same' if same else 'DIFFERENT'}")
+
+    for update in compile_delete_batch(rules):
+        sequential.update(update)
+        batched.update(update)
+    same_after_delete = canonical(sequential) == canonical(batched)
+    restored = set(sequential) == set(seed) and set(batched) == set(seed)
+    print(f"  delete: {len(sequential)} triples per rule, {len(batched)} batched -> {'same' if same_after_delete else 'DIFFERENT'}; "
+          f"seed has {len(seed)} -> {'restored' if restored else 'not restored'}")
+    return same and same_after_delete and restored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200, help="synthetic statements checked after the fixed ones")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = check([generate_concrete_rule(statement) for statement in STATEMENTS])
+    if args.size:
+        ok = check([generate_concrete_rule(statement) for statement in synthetic_corpus(args.size, args.seed)]) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Seeded generator of synthetic MCSK statements for every rule template shape RT1-RT8.
+
+Usage: python corpus.py SIZE [--seed N] [--mix RT1=2,RT7=1] > corpus.txt
+"""
+import argparse
+import itertools
+import random
+import sys
+
+# One sentence shape per rule template, in the wording the extractors expect
+SHAPES = {
+    1: "The result of {process} is a {product}",
+    2: "After {process} you should {next_process}",
+    3: "The {process} process involves a {machine}",
+    4: "The {product} is made of {material}",
+    5: "{assembly} is output of {assembly_process}",
+    6: "{component} is the input of {assembly}",
+    7: "{assembly} includes {process} and {next_process}",
+    8: "{component} is produced by {process} and {other_component} is produced by {next_process}",
+}
+
+PROCESSES = ["painting", "drying", "welding", "casting", "milling", "sanding", "drilling", "turning",
+             "grinding", "polishing", "curing", "cooling", "inspecting", "packing", "stamping", "forging",
+             "molding", "coating", "riveting", "bending", "cutting", "deburring", "annealing", "assembling"]
+QUALIFIERS = ["painted", "steel", "aluminium", "plastic", "welded", "machined", "coated", "cast",
+              "forged", "polished", "lego", "carbon", "brass", "molded", "stamped"]
+PARTS = ["object", "frame", "structure", "gear", "shaft", "bracket", "housing", "panel", "plate",
+         "bolt", "wheel", "axle", "piston", "valve", "cover", "chassis", "spring", "hinge"]
+MACHINES = ["dryer machine", "robot arm", "milling machine", "oven", "lathe", "press", "spray booth",
+            "welding robot", "grinder", "drill press", "conveyor", "injection molding machine"]
+MATERIALS = ["lego Blocks", "aluminium", "carbon fibre", "stainless steel", "ABS plastic", "brass",
+             "cast iron", "copper", "rubber", "glass fibre"]
+ASSEMBLIES = ["Lego", "Engine", "Wheel", "Gearbox", "Door", "Seat", "Pump", "Brake", "Motor", "Frame"]
+
+# Entity names are combined from the word lists, so larger corpora keep growing their vocabulary
+PRODUCTS = [f"{qualifier} {part}" for qualifier, part in itertools.product(QUALIFIERS, PARTS)]
+COMPONENTS = [part.capitalize() for part in PARTS] + [f"{qualifier.capitalize()} {part}" for qualifier, part in itertools.product(QUALIFIERS, PARTS)]
+
+
+def parse_mix(mix: str) -> dict:
+    """Parse a template mix such as "RT1=2,RT7=1" into {template id: weight}; unnamed templates get weight 0."""
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.strip().partition("=")
+        template_id = int(name.strip().upper().removeprefix("RT"))
+        if template_id not in SHAPES:
+            raise ValueError(f"Unknown rule template '{name}'")
+        weights[template_id] = float(weight or 1)
+    return weights
+
+
+def _slots(rng: random.Random) -> dict:
+    assembly = rng.choice(ASSEMBLIES)
+    return {
+        "process": rng.choice(PROCESSES),
+        "next_process": rng.choice(PROCESSES),
+        "product": rng.choice(PRODUCTS),
+        "machine": rng.choice(MACHINES),
+        "material": rng.choice(MATERIALS),
+        "assembly": f"{assembly} assembly",
+        "assembly_process": f"{assembly.lower()} assembly process",
+        "component": rng.choice(COMPONENTS),
+        "other_component": rng.choice(COMPONENTS),
+    }
+
+
+def generate_corpus(size: int, seed: int = 0, mix: dict = None):
+    """Yield ``size`` synthetic MCSK statements.
+
+    The same seed and mix always yield the same statements.
+
+    Args:
+    size (int): Number of statements.
+    seed (int): Seed of the random generator.
+    mix (dict): Relative weight per rule template id; uniform over RT1-RT8 by default.
+    """
+    rng = random.Random(seed)
+    mix = mix or dict.fromkeys(SHAPES, 1)
+    template_ids = [template_id for template_id, weight in mix.items() if weight > 0]
+    weights = [mix[template_id] for template_id in template_ids]
+    # Template choices are drawn in blocks to keep the per-statement cost low for 1M-statement corpora
+    while size > 0:
+        block = min(size, 4096)
+        for template_id in rng.choices(template_ids, weights, k=block):
+            yield SHAPES[template_id].format(**_slots(rng))
+        size -= block
+
+
+def synthetic_corpus(size: int, seed: int = 0, mix: dict = None) -> list:
+    return list(generate_corpus(size, seed, mix))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", type=parse_mix, default=None, help='template weights, e.g. "RT1=2,RT7=1"')
+    args = parser.parse_args()
+    for statement in generate_corpus(args.size, args.seed, args.mix):
+        sys.stdout.write(statement + "\n")
+
+
+if __name__ == '__main__':
+    main()
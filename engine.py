@@ -0,0 +1,273 @@
+"""In-memory forward chaining over the generated concrete rules.
+
+Loads ConcreteRule expressions such as
+
+    ∀x (painting(x) → ∃y (drying(y) ∧ precedes(x, y)))
+
+and applies them to a fact base until nothing new can be derived, so the
+consequences of a whole MCSK knowledge base can be computed and checked
+locally instead of through a SPARQL store.
+
+Evaluation is semi-naive: each round only joins rule bodies against the
+facts derived in the round before, rules are indexed by the predicates of
+their body, and facts by predicate and by predicate plus argument.
+Existential variables are filled with fresh witnesses, but only when the
+head is not already satisfied (a restricted chase). Rules such as "after painting you should paint" would
+otherwise generate witnesses forever, so witnesses are not created deeper
+than ``max_depth`` steps from the initial facts.
+"""
+import fol
+from function import ConcreteRule
+
+
+def parse_rule(expression: str) -> tuple:
+    """Split a concrete rule expression into its (body atoms, head atoms).
+
+    Atoms are (predicate, argument variables) pairs. A rule without "→",
+    such as RT8, has an empty body: it asserts its head once.
+    """
+    return fol.rule_atoms(fol.parse(expression))
+
+
+def _join_order(atoms: tuple, bound: set) -> tuple:
+    # Atoms sharing a variable with what is already bound go first, so every
+    # step of the join is an index lookup instead of a scan of the predicate
+    bound = set(bound)
+    remaining = list(atoms)
+    ordered = []
+    while remaining:
+        atom = max(remaining, key=lambda atom: sum(variable in bound for variable in atom[1]))
+        remaining.remove(atom)
+        ordered.append(atom)
+        bound.update(atom[1])
+    return tuple(ordered)
+
+
+#Rule Class: A concrete rule compiled for the engine, with the variables its head has to invent.
+class Rule:
+    __slots__ = ("expression", "body", "head", "existentials", "head_check")
+
+    def __init__(self, expression: str):
+        """Initialize the Rule class.
+
+        Args:
+        expression (str): A concrete rule expression, e.g. ConcreteRule.expression.
+        """
+        self.expression = expression
+        self.body, self.head = parse_rule(expression)
+        body_variables = {variable for _, args in self.body for variable in args}
+        self.existentials = tuple(dict.fromkeys(variable for _, args in self.head
+                                                for variable in args if variable not in body_variables))
+        self.head_check = _join_order(self.head, body_variables)
+
+    def __str__(self):
+        return self.expression
+
+
+#FactIndex Class: Facts grouped by predicate, with secondary indexes on each argument position.
+class FactIndex:
+    def __init__(self):
+        self.by_predicate = {}
+        self.by_argument = {}
+
+    def add(self, predicate: str, args: tuple) -> bool:
+        facts = self.by_predicate.get(predicate)
+        if facts is None:
+            facts = self.by_predicate[predicate] = set()
+        if args in facts:
+            return False
+        facts.add(args)
+        for position, value in enumerate(args):
+            self.by_argument.setdefault((predicate, position, value), []).append(args)
+        return True
+
+    def candidates(self, predicate: str, args: tuple, binding: dict):
+        # The facts agreeing with the first bound argument, or all facts of the predicate
+        for position, variable in enumerate(args):
+            value = binding.get(variable)
+            if value is not None:
+                return self.by_argument.get((predicate, position, value), ())
+        return self.by_predicate.get(predicate, ())
+
+    def without(self, other: "FactIndex") -> "_Difference":
+        return _Difference(self, other)
+
+    def __contains__(self, fact) -> bool:
+        return fact[1] in self.by_predicate.get(fact[0], ())
+
+    def __len__(self):
+        return sum(len(facts) for facts in self.by_predicate.values())
+
+
+#_Difference Class: The facts of one index that are not in another, without copying them.
+class _Difference:
+    __slots__ = ("index", "excluded")
+
+    def __init__(self, index: FactIndex, excluded: FactIndex):
+        self.index = index
+        self.excluded = excluded
+
+    def candidates(self, predicate: str, args: tuple, binding: dict):
+        excluded = self.excluded.by_predicate.get(predicate)
+        candidates = self.index.candidates(predicate, args, binding)
+        if not excluded:
+            return candidates
+        return [values for values in candidates if values not in excluded]
+
+
+def _unify(args: tuple, values: tuple, binding: dict):
+    extended = None
+    for variable, value in zip(args, values):
+        bound = binding.get(variable) if extended is None else extended.get(variable)
+        if bound is None:
+            if extended is None:
+                extended = dict(binding)
+            extended[variable] = value
+        elif bound != value:
+            return None
+    return binding if extended is None else extended
+
+
+def _join(atoms: tuple, sources: tuple, binding: dict):
+    # Depth-first join of the atoms, each one matched against its own FactIndex
+    if not atoms:
+        yield binding
+        return
+    (predicate, args), index = atoms[0], sources[0]
+    for values in index.candidates(predicate, args, binding):
+        extended = _unify(args, values, binding)
+        if extended is not None:
+            yield from _join(atoms[1:], sources[1:], extended)
+
+
+#Engine Class: A fact base and the rules that are chained forward over it.
+class Engine:
+    def __init__(self, rules=(), max_depth: int = 3, max_rounds: int = 1000):
+        """Initialize the Engine class.
+
+        Args:
+        rules (iterable): ConcreteRules or rule expressions to load.
+        max_depth (int): Longest chain of invented witnesses behind any fact.
+        max_rounds (int): Semi-naive rounds run before giving up on reaching a fixpoint.
+        """
+        self.rules = []
+        self.facts = FactIndex()
+        self.max_depth = max_depth
+        self.max_rounds = max_rounds
+        self.rounds = 0
+        self.saturated = False
+        self._depth = {}
+        self._witnesses = 0
+        self._pending = []
+        self._fresh_rules = []
+        self._triggers = {}
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule) -> Rule:
+        """Load a ConcreteRule or a rule expression; it takes part in the next run()."""
+        compiled = Rule(rule.expression if isinstance(rule, ConcreteRule) else rule)
+        self.rules.append(compiled)
+        self._fresh_rules.append(compiled)
+        for position, (predicate, _) in enumerate(compiled.body):
+            self._triggers.setdefault(predicate, []).append((compiled, position))
+        self.saturated = False
+        return compiled
+
+    def add_fact(self, predicate: str, *args: str) -> bool:
+        """Assert a fact, e.g. engine.add_fact("painting", "p1"); returns False if it was already known."""
+        if not self.facts.add(predicate, args):
+            return False
+        self._pending.append((predicate, args))
+        self.saturated = False
+        return True
+
+    def add_facts(self, facts):
+        for predicate, *args in facts:
+            self.add_fact(predicate, *args)
+
+    def _witness(self, depth: int) -> str:
+        self._witnesses += 1
+        term = f"_:w{self._witnesses}"
+        self._depth[term] = depth
+        return term
+
+    def _fire(self, rule: Rule, binding: dict, derived: list):
+        if rule.existentials:
+            # A head that already holds needs no new witnesses
+            for _ in _join(rule.head_check, (self.facts,) * len(rule.head_check), binding):
+                return
+            depth = 1 + max((self._depth.get(value, 0) for value in binding.values()), default=0)
+            if depth > self.max_depth:
+                return
+            binding = dict(binding)
+            for variable in rule.existentials:
+                binding[variable] = self._witness(depth)
+        for predicate, args in rule.head:
+            values = tuple(binding[variable] for variable in args)
+            if self.facts.add(predicate, values):
+                derived.append((predicate, values))
+
+    def run(self) -> int:
+        """Apply the rules until no new fact is derived and return the number of facts derived.
+
+        Sets ``saturated`` to False when ``max_rounds`` was reached first.
+        """
+        before = len(self.facts)
+        delta, self._pending = self._pending, []
+        if self._fresh_rules:
+            # Rules loaded since the last run have not seen the facts that were
+            # already there; the pending facts are joined in the rounds below.
+            # A rule without a body holds unconditionally and fires once here.
+            pending = FactIndex()
+            for predicate, args in delta:
+                pending.add(predicate, args)
+            known = self.facts.without(pending)
+            derived = []
+            for rule in self._fresh_rules:
+                for binding in list(_join(rule.body, (known,) * len(rule.body), {})):
+                    self._fire(rule, binding, derived)
+            delta += derived
+            self._fresh_rules = []
+
+        rounds = 0
+        while delta and rounds < self.max_rounds:
+            rounds += 1
+            grouped = {}
+            for predicate, args in delta:
+                grouped.setdefault(predicate, []).append(args)
+            new = old = None
+            derived = []
+            for predicate, facts in grouped.items():
+                for rule, position in self._triggers.get(predicate, ()):
+                    body = rule.body
+                    if len(body) == 1:
+                        for values in facts:
+                            binding = _unify(body[0][1], values, {})
+                            if binding is not None:
+                                self._fire(rule, binding, derived)
+                        continue
+                    if new is None:
+                        new = FactIndex()
+                        for args in delta:
+                            new.add(*args)
+                        old = self.facts.without(new)
+                    # Semi-naive: the atom at ``position`` ranges over the new facts, the
+                    # ones before it over the older facts and the ones after it over all facts
+                    sources = (old,) * position + (new,) + (self.facts,) * (len(body) - position - 1)
+                    for binding in list(_join(body, sources, {})):
+                        self._fire(rule, binding, derived)
+            delta = derived
+
+        self.rounds += rounds
+        self.saturated = not delta
+        if delta:
+            self._pending = delta
+        return len(self.facts) - before
+
+    def query(self, predicate: str) -> set:
+        """Return the argument tuples of every known fact of ``predicate``."""
+        return set(self.facts.by_predicate.get(predicate, ()))
+
+    def __len__(self):
+        return len(self.facts)
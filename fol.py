@@ -0,0 +1,209 @@
+"""Parser for the first-order logic syntax of the rule templates.
+
+    ∀x (painting(x) → ∃y (drying(y) ∧ precedes(x, y)))
+
+parses to
+
+    ForAll(("x",), Implies(Atom("painting", ("x",)),
+                           Exists(("y",), And((Atom("drying", ("y",)), Atom("precedes", ("x", "y")))))))
+
+Nodes are immutable tuples, so a parsed formula can be cached and shared.
+Predicate names and variables are interned, and parse() is memoized per
+expression. Predicate names may contain spaces ("painted object(x)"), as
+entity names extracted from MCSK statements do.
+"""
+import sys
+from functools import lru_cache
+from typing import NamedTuple
+
+FORALL, EXISTS, AND, IMPLIES = "∀", "∃", "∧", "→"
+_PUNCTUATION = "(),"
+_OPERATORS = FORALL + EXISTS + AND + IMPLIES
+
+
+class Atom(NamedTuple):
+    predicate: str
+    args: tuple
+
+    def __str__(self):
+        return f"{self.predicate}({', '.join(self.args)})"
+
+
+class And(NamedTuple):
+    operands: tuple
+
+    def __str__(self):
+        return f" {AND} ".join(_format_operand(operand) for operand in self.operands)
+
+
+class Implies(NamedTuple):
+    antecedent: object
+    consequent: object
+
+    def __str__(self):
+        return f"{_format_operand(self.antecedent)} {IMPLIES} {_format_operand(self.consequent, implication=True)}"
+
+
+class ForAll(NamedTuple):
+    variables: tuple
+    body: object
+
+    def __str__(self):
+        return f"{FORALL}{','.join(self.variables)} ({self.body})"
+
+
+class Exists(NamedTuple):
+    variables: tuple
+    body: object
+
+    def __str__(self):
+        return f"{EXISTS}{','.join(self.variables)} ({self.body})"
+
+
+def _format_operand(formula, implication: bool = False) -> str:
+    # Nested implications and conjunctions are parenthesized; the right side of → is not
+    if isinstance(formula, (And, Implies)) and not (implication and isinstance(formula, Implies)):
+        return f"({formula})"
+    return str(formula)
+
+
+def _tokenize(expression: str) -> list:
+    tokens = []
+    name = []
+    for char in expression:
+        if char in _PUNCTUATION or char in _OPERATORS:
+            if name:
+                tokens.append("".join(name).strip())
+                name = []
+            tokens.append(char)
+        else:
+            name.append(char)
+    if name:
+        tokens.append("".join(name).strip())
+    return [token for token in tokens if token]
+
+
+#_Parser Class: Recursive-descent parser over the tokens of one expression.
+class _Parser:
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: str = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f"Expected '{expected or 'a token'}' at token {self.position} of '{self.expression}'")
+        self.position += 1
+        return token
+
+    def name(self) -> str:
+        token = self.take()
+        if token in _PUNCTUATION or token in _OPERATORS:
+            raise ValueError(f"Expected a name at token {self.position - 1} of '{self.expression}'")
+        return sys.intern(token)
+
+    def names(self) -> tuple:
+        names = [self.name()]
+        while self.peek() == ",":
+            self.take(",")
+            names.append(self.name())
+        return tuple(names)
+
+    # formula := conjunction ("→" formula)?
+    def formula(self):
+        antecedent = self.conjunction()
+        if self.peek() == IMPLIES:
+            self.take(IMPLIES)
+            return Implies(antecedent, self.formula())
+        return antecedent
+
+    # conjunction := unary ("∧" unary)*
+    def conjunction(self):
+        operands = [self.unary()]
+        while self.peek() == AND:
+            self.take(AND)
+            operands.append(self.unary())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    # unary := ("∀" | "∃") names unary | "(" formula ")" | name "(" names ")"
+    def unary(self):
+        token = self.peek()
+        if token in (FORALL, EXISTS):
+            self.take()
+            variables = self.names()
+            return (ForAll if token == FORALL else Exists)(variables, self.unary())
+        if token == "(":
+            self.take("(")
+            formula = self.formula()
+            self.take(")")
+            return formula
+        predicate = self.name()
+        self.take("(")
+        args = self.names()
+        self.take(")")
+        return Atom(predicate, args)
+
+
+@lru_cache(maxsize=8192)
+def parse(expression: str):
+    """Parse a rule expression into its formula tree; raises ValueError on a syntax error."""
+    parser = _Parser(expression)
+    formula = parser.formula()
+    if parser.peek() is not None:
+        raise ValueError(f"Unexpected '{parser.peek()}' at token {parser.position} of '{expression}'")
+    return formula
+
+
+def atoms(formula) -> list:
+    """Every atom of the formula, in the order it is written."""
+    if isinstance(formula, Atom):
+        return [formula]
+    if isinstance(formula, And):
+        return [atom for operand in formula.operands for atom in atoms(operand)]
+    if isinstance(formula, Implies):
+        return atoms(formula.antecedent) + atoms(formula.consequent)
+    return atoms(formula.body)
+
+
+def map_atoms(formula, function):
+    """Rebuild the formula with every atom replaced by ``function(index, atom)``, atoms numbered as in atoms()."""
+    counter = [0]
+
+    def rebuild(node):
+        if isinstance(node, Atom):
+            counter[0] += 1
+            return function(counter[0] - 1, node)
+        if isinstance(node, And):
+            return And(tuple(rebuild(operand) for operand in node.operands))
+        if isinstance(node, Implies):
+            antecedent = rebuild(node.antecedent)
+            return Implies(antecedent, rebuild(node.consequent))
+        return type(node)(node.variables, rebuild(node.body))
+    return rebuild(formula)
+
+
+def _conjuncts(formula) -> tuple:
+    while isinstance(formula, (ForAll, Exists)):
+        formula = formula.body
+    if isinstance(formula, Atom):
+        return (formula,)
+    if isinstance(formula, And):
+        return tuple(atom for operand in formula.operands for atom in _conjuncts(operand))
+    raise ValueError(f"'{formula}' is not a conjunction of atoms")
+
+
+def rule_atoms(formula) -> tuple:
+    """Split a rule formula into its (body atoms, head atoms).
+
+    Quantifiers are dropped. A formula without "→", such as RT8, has an
+    empty body and asserts its atoms.
+    """
+    while isinstance(formula, ForAll):
+        formula = formula.body
+    if isinstance(formula, Implies):
+        return _conjuncts(formula.antecedent), _conjuncts(formula.consequent)
+    return (), _conjuncts(formula)
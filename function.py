@@ -1,12 +1,102 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+from typing import NamedTuple
+
+import fol
+import metrics
+from cache import LRUCache, SQLiteCache
+from names import MCSKG_NAMESPACE, iri_name, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Slot records collected for the current request by trace_slots(), None when tracing is off
+_trace_records = contextvars.ContextVar("mcsk_trace_records", default=None)
+
+
 class RuleTemplate:
-    def __init__(self, expression: str, id: int = None):
+    def __init__(self, expression: str, id: int = None, slots: dict = None):
         """Initialize the RuleTemplate class with an expression.
 
+        The placeholders named in ``slots`` are compiled once into a list of
+        literal fragments, so specializing the template is a single join.
+
         Args:
         expression (str): A logical expression containing placeholders.
+        slots (dict): Maps each slot name to its placeholder atom in the expression, e.g. {"product": "product(x)"}.
         """
         self.id = id
         self.expression = expression
+        self.trigger = None
+        self.extract = None
+        self.update = None
+        self.sparql = None
+        self.slots, self._parts, self._slot_positions = _compile_template(expression, slots or {})
+        self._sparql_parts = self._sparql_positions = None
+        self._shape = None
+        self.formula = fol.parse(expression)
+        # Position of each slot's placeholder among the atoms of the formula
+        template_atoms = fol.atoms(self.formula)
+        self._slot_atoms = tuple(template_atoms.index(fol.parse(slots[slot])) for slot in self.slots)
+
+    def fill(self, values: tuple) -> str:
+        """Substitute the slot values into the expression.
+
+        Args:
+        values (tuple): One entity name per slot, in the order of ``self.slots``.
+        """
+        parts = self._parts.copy()
+        for position, index in self._slot_positions:
+            parts[position] = values[index]
+        return "".join(parts)
+
+    def bind(self, formula) -> tuple:
+        """Recover the slot values of a formula specialized from this template.
+
+        Raises ValueError when the formula does not have the template's shape.
+
+        Args:
+        formula (fol formula): A parsed concrete rule expression.
+        """
+        concrete_atoms = fol.atoms(formula)
+        if len(concrete_atoms) != len(fol.atoms(self.formula)):
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        values = tuple(concrete_atoms[index].predicate for index in self._slot_atoms)
+        renamed = dict(zip(self._slot_atoms, values))
+        expected = fol.map_atoms(self.formula, lambda index, atom: atom._replace(predicate=renamed[index]) if index in renamed else atom)
+        if expected != formula:
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        return values
+
+    def fill_sparql(self, values: tuple) -> str:
+        """Substitute the slot values into the SPARQL update of the template.
+
+        Args:
+        values (tuple): One entity name per slot, in the order of ``self.slots``.
+        """
+        if self._sparql_parts is None:
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        key = self.rule_key(values)
+        parts = self._sparql_parts.copy()
+        for position, index in self._sparql_positions:
+            parts[position] = key if index is None else iri_name(values[index])
+        return "".join(parts)
+
+    def rule_key(self, values: tuple) -> str:
+        """Key of the rule binding ``values`` to the slots of this template, see function.rule_key().
+
+        Args:
+        values (tuple): One entity name per slot, in the order of ``self.slots``.
+        """
+        if self._shape is None:
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        key = "\x1f".join((self._shape, *values))
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
 
     def __str__(self):
         return self.expression
@@ -26,367 +116,569 @@ class MCSK:
 
 #ConcreteRule Class: Represents a concrete rule derived from a rule template by replacing its placeholders with specific classes/instances.
 class ConcreteRule:
-    def __init__(self, expression: str, id: int = None):
+    __slots__ = ("expression", "id", "bindings")
+
+    def __init__(self, expression: str, id: int = None, bindings: tuple = None):
         """Initialize the ConcreteRule class with an expression.
 
+        Concrete rules are immutable, so cached ones can be shared between threads.
+
         Args:
         expression (str): A logical expression that's the result of substituting placeholders in a RuleTemplate with information from an MCSK.
+        bindings (tuple): The entity name bound to each slot of the rule template, in the order of its ``slots``.
         """
-        self.id = id
-        self.expression = expression
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "expression", expression)
+        object.__setattr__(self, "bindings", None if bindings is None else tuple(bindings))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConcreteRule is immutable")
+
+    def __reduce__(self):
+        return ConcreteRule, (self.expression, self.id, self.bindings)
+
+    def __eq__(self, other):
+        if not isinstance(other, ConcreteRule):
+            return NotImplemented
+        return (self.expression, self.id, self.bindings) == (other.expression, other.id, other.bindings)
+
+    def __hash__(self):
+        return hash((self.expression, self.id, self.bindings))
+
+    @property
+    def template(self) -> "RuleTemplate":
+        return TEMPLATE_REGISTRY.get(self.id)
+
+    @property
+    def formula(self):
+        """The parsed expression (see fol.py), shared by every rule with the same expression."""
+        return fol.parse(self.expression)
+
+    def slot(self, name: str) -> str:
+        """Return the entity name bound to a slot, e.g. rule.slot("machine")."""
+        return self.slot_bindings()[name]
+
+    def slot_bindings(self) -> dict:
+        rule = bind_rule(self)
+        return dict(zip(rule.template.slots, rule.bindings))
 
     def __str__(self):
         return self.expression
 
-RT1 = RuleTemplate("∀x (product(x) → ∃y (process(y) ∧ isOutputOf(x, y)))", 1)
-RT2 = RuleTemplate("∀x (process(x) → ∃y (process(y) ∧ precedes(x, y)))", 2)
-RT3 = RuleTemplate("∀x (process(x) → ∃y (machine(y) ∧ participatesAtSomeTime(y, x)))", 3)
-RT4 = RuleTemplate("∀x (product(x) → ∃y (material(y) ∧ partOf(y, x)))", 4)
-RT5 = RuleTemplate("∀x (assembly(x) → ∃y (assemblyProcess(y) ∧ isOutputOf(x, y)))", 5)
-RT6 = RuleTemplate("∀x (assembly(x) → ∃y (component(y) ∧ isInputOf(y, x)))" ,6)
-RT7 = RuleTemplate("∀x (assembly(x) → ∃y,z (picking(y) ∧ fixing(z) ∧ partOf(y, x) ∧ partOf(z, x)))", 7)
-RT8 = RuleTemplate("∀x,y (component1(x) ∧ component2(y) ∧ process(p1) ∧ isOutputOf(y, p1) ∧ process(p2) ∧ isOutputOf(x, p2))", 8)
-def determine_rule_template(mcsk: MCSK) -> RuleTemplate:
-    if "result" in mcsk.statement:
-        return RT1
-    elif "After" in mcsk.statement:
-        return RT2
-    elif "involves" in mcsk.statement:
-        return RT3
-    elif "made of" in mcsk.statement:
-        return RT4
-    elif "is output of" in mcsk.statement:
-        return RT5
-    elif "is the input of" in mcsk.statement:
-        return RT6
-    elif "includes" in mcsk.statement:
-        return RT7
-    elif "is produced by" in mcsk.statement:
-        return RT8
-    else:
+
+def _split_fragments(text: str, spans: list):
+    # Cut the text at every (start, end, slot index) span. The literal
+    # fragments are kept in a list with a hole per span.
+    parts = []
+    slot_positions = []
+    previous_end = 0
+    for start, end, index in sorted(spans):
+        parts.append(text[previous_end:start])
+        slot_positions.append((len(parts), index))
+        parts.append(None)
+        previous_end = end
+    parts.append(text[previous_end:])
+    return parts, tuple(slot_positions)
+
+
+def _compile_template(expression: str, slots: dict):
+    # Locate the predicate name of every placeholder atom; slots are numbered
+    # in the order they appear in the expression.
+    spans = []
+    for slot, atom in slots.items():
+        start = expression.find(atom)
+        if start < 0:
+            raise ValueError(f"Placeholder '{atom}' not found in template '{expression}'")
+        spans.append((start, start + atom.index("("), slot))
+    spans.sort()
+    names = tuple(slot for _, _, slot in spans)
+    parts, slot_positions = _split_fragments(expression, [(start, end, index) for index, (start, end, _) in enumerate(spans)])
+    return names, parts, slot_positions
+
+
+_SPARQL_SLOT_PATTERN = re.compile(r"\{(\w+)\}")
+_RULE_MARKER = "_rule"
+
+
+def _compile_sparql(sparql: str, slots: tuple):
+    # "{slot}" markers in the SPARQL text become holes filled with IRI names,
+    # and "{_rule}" markers holes filled with the rule's key
+    spans = []
+    for marker in _SPARQL_SLOT_PATTERN.finditer(sparql):
+        if marker.group(1) == _RULE_MARKER:
+            spans.append((marker.start(), marker.end(), None))
+            continue
+        if marker.group(1) not in slots:
+            raise ValueError(f"Unknown slot '{marker.group(1)}' in SPARQL template")
+        spans.append((marker.start(), marker.end(), slots.index(marker.group(1))))
+    return _split_fragments(sparql, spans)
+
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+SPARQL_PREFIX = "PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>\n"
+
+_VARIABLE_NAME_PATTERN = re.compile(r"[A-Za-z]\w*\Z")
+# Absolute IRIs, without the characters an IRI reference may not contain
+_PREDICATE_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*:[^\x00-\x20<>\"{}|^`\\]+\Z")
+
+
+#UpdatePattern Class: The graph pattern of a rule template's SPARQL update, declared as data.
+class UpdatePattern:
+    __slots__ = ("match", "minted", "links")
+
+    def __init__(self, match: tuple = None, minted: tuple = (), links: tuple = ()):
+        """Initialize the UpdatePattern class.
+
+        For every instance of the matched class (or once, without one) the
+        update mints a fresh instance of the class of each minted slot,
+        types it, and inserts the links between the instances.
+
+        Args:
+        match (tuple): (variable, slot) of the instances the update applies to, or None.
+        minted (tuple): (variable, slot) of every fresh instance, in the order they are minted.
+        links (tuple): (subject variable, predicate IRI, object variable) of every inserted relation.
+        """
+        self.match = match
+        self.minted = tuple(minted)
+        self.links = tuple(links)
+
+    @property
+    def variables(self) -> tuple:
+        return ((self.match[0],) if self.match else ()) + tuple(variable for variable, _ in self.minted)
+
+
+def _check_update(update: UpdatePattern, slots: tuple):
+    # Everything downstream (batched updates, deletes, triple plans) is built
+    # from the pattern, so a template whose pattern they cannot express is
+    # refused at registration
+    declared = ([update.match] if update.match else []) + list(update.minted)
+    if not update.minted:
+        raise ValueError("The update of a rule template must mint at least one instance")
+    for variable, slot in declared:
+        if not _VARIABLE_NAME_PATTERN.match(variable) or variable.startswith("slot_"):
+            raise ValueError(f"Invalid variable name '{variable}' in rule template update")
+        if slot not in slots:
+            raise ValueError(f"Unknown slot '{slot}' in rule template update")
+    variables = update.variables
+    if len(set(variables)) != len(variables):
+        raise ValueError("Every variable of a rule template update must be declared once")
+    neighbours = {variable: set() for variable in variables}
+    for subject, predicate, object_ in update.links:
+        if subject not in neighbours or object_ not in neighbours:
+            raise ValueError(f"Link ({subject}, {predicate}, {object_}) uses an undeclared variable")
+        if not _PREDICATE_PATTERN.match(predicate):
+            raise ValueError(f"Invalid predicate IRI '{predicate}' in rule template update")
+        neighbours[subject].add(object_)
+        neighbours[object_].add(subject)
+    if update.match:
+        # Minted instances are found again through their links to the matched one
+        reached, frontier = {update.match[0]}, [update.match[0]]
+        while frontier:
+            for neighbour in neighbours[frontier.pop()] - reached:
+                reached.add(neighbour)
+                frontier.append(neighbour)
+        if reached != set(variables):
+            raise ValueError("Every minted instance must be linked to the matched instance")
+
+
+def _update_shape(update: UpdatePattern, slots: tuple) -> str:
+    # The pattern with slots by position: updates that only differ in slot names (RT1 and RT5) have the same shape
+    index = slots.index
+    match = update.match and (update.match[0], index(update.match[1]))
+    return repr((match, tuple((variable, index(slot)) for variable, slot in update.minted), update.links))
+
+
+def _update_sparql(update: UpdatePattern) -> str:
+    # The SPARQL update of a pattern, with "{slot}" markers where the IRI names
+    # go and "{_rule}" markers where the rule key goes
+    lines = [f"{SPARQL_PREFIX}INSERT {{"]
+    lines += [f"    ?{variable} rdf:type <{MCSKG_NAMESPACE}{{{slot}}}> ." for variable, slot in update.minted]
+    lines += [f"    ?{subject} <{predicate}> ?{object_} ." for subject, predicate, object_ in update.links]
+    lines += ["}", "WHERE {"]
+    if update.match:
+        lines.append(f"    ?{update.match[0]} rdf:type <{MCSKG_NAMESPACE}{{{update.match[1]}}}> .")
+    lines += [f'    BIND(URI(CONCAT("{MCSKG_NAMESPACE}{{{slot}}}_{{{_RULE_MARKER}}}_", STRUUID())) AS ?{variable})'
+              for variable, slot in update.minted]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+# Rule templates registered by id, and their trigger phrases. When a
+# statement contains several triggers, the one registered first decides,
+# like the original if/elif cascade.
+TEMPLATE_REGISTRY = {}
+TEMPLATE_TRIGGERS = {}
+_TRIGGER_PRIORITY = {}
+_TRIGGER_PATTERN = None
+
+
+def register_template(template: RuleTemplate, trigger: str, extract, update: UpdatePattern = None) -> RuleTemplate:
+    """Register a rule template and the trigger phrase that selects it.
+
+    Raises ValueError when the update pattern is malformed.
+
+    Args:
+    template (RuleTemplate): The template, with an id and its slots.
+    trigger (str): The phrase that marks an MCSK statement of this shape.
+    extract (callable): Takes the text before and after the trigger and returns the slot bindings.
+    update (UpdatePattern): The triples the template's SPARQL update matches and inserts.
+    """
+    global _TRIGGER_PATTERN
+    if update is not None:
+        _check_update(update, template.slots)
+    template.trigger = trigger
+    template.extract = extract
+    if update is not None:
+        template.update = update
+        template._shape = _update_shape(update, template.slots)
+        template.sparql = _update_sparql(update)
+        template._sparql_parts, template._sparql_positions = _compile_sparql(template.sparql, template.slots)
+    TEMPLATE_REGISTRY[template.id] = template
+    TEMPLATE_TRIGGERS[trigger] = template
+    _TRIGGER_PRIORITY.setdefault(trigger, len(_TRIGGER_PRIORITY))
+    # One alternation over every trigger finds them all in a single pass
+    _TRIGGER_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in TEMPLATE_TRIGGERS))
+    return template
+
+
+def _entity(text: str) -> str:
+    # Strip a trailing copula around an entity name; articles and the final
+    # period are dropped by names.normalize_name for every template
+    name = text.strip()
+    if name.endswith(" is"):
+        name = name[:-3].rstrip()
+    if not name:
         raise ValueError("Unknown MCSK format!")
+    return name
 
 
-def SpecializeRule(RT: RuleTemplate, MCSK: MCSK) -> ConcreteRule:
-    words = MCSK.statement.split()
+def subject_object(subject_slot: str, object_slot: str):
+    """Build an extractor for "<subject> <trigger> <object>" statements.
 
-    # Handle RT1: "The result of X is a Y." #The result of painting is a painted object
-    if "result" in MCSK.statement:
-        words = MCSK.statement.split()
-        process_name = words[3]
-        product_name = ' '.join(words[-3:]).replace('a ', '').replace('an ', '').replace('is ', '').rstrip('.')
-        CR_expression = RT.expression.replace("product(x)", f"{product_name}(x)")
-        CR_expression = CR_expression.replace("process(y)", f"{process_name}(y)")
-        CR_expression = CR_expression.replace("isOutputOf(x, y)", "isOutputOf(x, y)")
+    Args:
+    subject_slot (str): Slot bound to the text before the trigger phrase.
+    object_slot (str): Slot bound to the text after the trigger phrase.
+    """
+    def extract(head: str, tail: str) -> dict:
+        return {subject_slot: _entity(head), object_slot: _entity(tail)}
+    return extract
 
-    # Handle RT2: "X process After Y process." #After painting you should dry
-    elif "After" in MCSK.statement:
-        preceding_process = words[1]  # In the given example, this should be "painting"
-        succeeding_process = words[4]  # In the given example, this should be "dry"
-        CR_expression = RT.expression.replace("process(x)", f"{preceding_process}(x)")
-        CR_expression = CR_expression.replace("process(y)", f"{succeeding_process}(y)")
-        CR_expression = CR_expression.replace("precedes(y, x)", "precedes(y, x)")
 
-    # Handle RT3: "X process involves Y machine." #The drying process involves a dryer machine
-    else:
-        process_name = words[1]  # This will extract "process" from the MCSK statement
-        machine_name = ' '.join(words[-2:])  # This will extract "machine" from the MCSK statement
-        machine_name = machine_name.replace('a ', '').replace('an ', '').rstrip('.')
-        CR_expression = RT.expression.replace("process(x)", f"{process_name}(x)")
-        CR_expression = CR_expression.replace("machine(y)", f"{machine_name}(y)")
-        CR_expression = CR_expression.replace("participatesAtSomeTime(y, x)", "participatesAtSomeTime(y, x)")
-
-    # Handle RT4: "X is made of Y." # e.g., The lego structure is made of lego Blocks
-    if "made of" in MCSK.statement:
-        words = MCSK.statement.split()
-        product_name = words[1]  # Assuming the product name is the first word
-        material_name = ' '.join(words[-3:]).replace('is ', '').replace('made of ', '').rstrip('.')
-        CR_expression = RT4.expression.replace("product(x)", f"{product_name}(x)")
-        CR_expression = CR_expression.replace("material(y)", f"{material_name}(y)")
-        CR_expression = CR_expression.replace("ispartOf(y, x)", "ispartOf(y, x)")
-
-        # Handle RT5: "Lego assembly is the output of lego assembly process."
-    if "is output of" in MCSK.statement:
-        words = MCSK.statement.split()
-        assembly_name = words[0]  # Assuming the assembly name is the first word
-        assembly_process_name = ' '.join(words[-2:]).replace('is ', '').replace('output of ', '').rstrip('.')
-        CR_expression = RT5.expression.replace("assembly(x)", f"{assembly_name}(x)")
-        CR_expression = CR_expression.replace("assemblyProcess(y)", f"{assembly_process_name}(y)")
-        CR_expression = CR_expression.replace("isOutputOf(y, x)", "isOutputOf(x, y)")
-
-    # Handle RT6: "Lego is the input of lego assembly."
-    if "is the input of" in MCSK.statement:
-      words = MCSK.statement.split()
-      split_index = words.index("is")  # Find the position of 'is' in the statement
-      assembly_name = ' '.join(words[split_index + 4:]).replace('is ', '').replace('the input of ', '').rstrip('.')  # Everything after "is the input of"
-      component_name = ' '.join(words[:split_index]).rstrip('.')  # Everything before "is the input of"
-
-    # Debugging prints
-      print(f"Extracted assembly_name: {assembly_name}")
-      print(f"Extracted component_name: {component_name}")
-
-      CR_expression = RT6.expression.replace("assembly(x)", f"{assembly_name}(x)")
-      CR_expression = CR_expression.replace("component(y)", f"{component_name}(y)")
-      CR_expression = CR_expression.replace("isInputOf(y, x)", "isInputOf(y, x)")
-    # Handle RT7: "Lego assembly involves process1 and process2."
-    if "includes" in MCSK.statement:
-      words = MCSK.statement.split()
-      assembly_name = words[0]  # Assuming the assembly name is the first word
-      process_names = words[2:]  # Assuming processes start after 'involves'
-
-      # Extracting two process names
-      process1_name = process_names[0]
-      process2_name = process_names[2]  # Assuming 'and' is in between
-      # Debugging prints
-      print(f"Extracted process1_name: {process1_name}")
-      print(f"Extracted process2_name: {process2_name}")
-      # Create the ConcreteRule expression
-      CR_expression = RT7.expression.replace("assembly(x)", f"{assembly_name}(x)")
-      CR_expression = CR_expression.replace("process(y)", f"{process1_name}(y)")
-      CR_expression = CR_expression.replace("process(z)", f"{process2_name}(z)")
-      CR_expression = CR_expression.replace("partOf(y, x)", "partOf(y, x)")
-      CR_expression = CR_expression.replace("partOf(z, x)", "partOf(z, x)")
-    # Handle RT8: "Component1 [Name] is produced by process [Process1] and Component2 [Name] is produced by process [Process2]."
-
-    if "is produced by" in MCSK.statement:
-      # Split the statement into two parts: one for each component and its process
-      parts = MCSK.statement.split(" and ")
-      component1_part = parts[0].split(" is produced by ")
-      component2_part = parts[1].split(" is produced by ")
-
-     # Extract component and process names
-      component1_name = component1_part[0].strip()
-      process1_name = component1_part[1].strip()
-      component2_name = component2_part[0].strip()
-      process2_name = component2_part[1].strip()
-
-      # Debugging prints
-      print(f"Extracted component1_name: {component1_name}")
-      print(f"Extracted component2_name: {component2_name}")
-      print(f"Extracted process1_name: {process1_name}")
-      print(f"Extracted process2_name: {process2_name}")
-
-       #Create the ConcreteRule expression
-      CR_expression = RT8.expression.replace("component1(x)", f"{component1_name}(x)")
-      CR_expression = CR_expression.replace("component2(y)", f"{component2_name}(y)")
-      CR_expression = CR_expression.replace("process(p1)", f"{process1_name}(p1)")
-      CR_expression = CR_expression.replace("isOutputOf(y, p1)", "isOutputOf(y, p1)")
-      CR_expression = CR_expression.replace("process(p2)", f"{process2_name}(p2)")
-      CR_expression = CR_expression.replace("isOutputOf(x, p2)", "isOutputOf(x, p2)")
-
-    return ConcreteRule(CR_expression, RT.id)
+# RT1: "The result of X is a Y." #The result of painting is a painted object
+def _extract_result(head: str, tail: str) -> dict:
+    process_part, _, product_part = tail.partition(" is ")
+    return {"process": _entity(process_part.lstrip().removeprefix("of ")), "product": _entity(product_part)}
 
 
-def generate_concrete_rule(mcsk_input: str) -> ConcreteRule:
-    mcsk = MCSK(mcsk_input)
-    rt = determine_rule_template(mcsk)
-    return SpecializeRule(rt, mcsk)
-def generate_sparql_query(concrete_rule: ConcreteRule) -> str:
-    expression = concrete_rule.expression
-    id = concrete_rule.id
-    sparql_query = ""
-
-    # Example of how to parse the expression and generate a SPARQL query
-    if "isOutputOf" in expression and id==1 :
-        # Extracting product and process names from the expression for RT1 ∀x (painted object(x) → ∃y (painting(y) ∧ isOutputOf(x, y)))
-        product_name = expression.split("(")[1].split(")")[0]
-        process_name = expression.split("(")[3].split(")")[0]
-         # Print statements for debugging
-        print(f"Extracted product name: {product_name}")
-        print(f"Extracted process name: {process_name}")
-
-        # Correctly replacing spaces with underscores for valid IRIs
-        process_name_formatted = process_name.replace(' ', '_')
-        product_name_formatted = product_name.replace(' ', '_')
-
-        sparql_query = f"""
-        INSERT {{
-          ?y rdf:type <http://www.mcskg.enit.fr/{process_name_formatted}> .
-          ?x <https://spec.industrialontologies.org/ontology/core/Core/isOutputOf> ?y .
-          }}
-        WHERE {{
-          ?x rdf:type <http://www.mcskg.enit.fr/{product_name_formatted}> .
-          BIND(URI(CONCAT("http://www.mcskg.enit.fr/{process_name_formatted}_", STRUUID())) AS ?y)
-          }}
-          """
-    elif "precedes" in expression:
-        # Similar parsing for RT2
-        preceding_process = expression.split("(")[1].split(")")[0]
-        succeeding_process = expression.split("(")[3].split(")")[0]
-        # Print statements for debugging
-        print(f"Extracted preceding_process name: {preceding_process}")
-        print(f"Extracted succeeding_process name: {succeeding_process}")
-
-        # Correctly replacing spaces with underscores for valid IRIs
-        preceding_process_formatted = preceding_process.replace(' ', '_')
-        succeeding_process_formatted = succeeding_process.replace(' ', '_')
-
-        sparql_query = f"""
-        INSERT {{
-        ?y rdf:type <"http://www.mcskg.enit.fr/{succeeding_process_formatted}"> .
-        ?y <http://purl.obolibrary.org/obo/BFO_0000063> ?x .
-        }}
-         WHERE {{
-        ?x rdf:type <"http://www.mcskg.enit.fr/{preceding_process_formatted}">.
-        BIND(URI(CONCAT("http://www.mcskg.enit.fr/{succeeding_process_formatted}_", STRUUID())) AS ?y)
-        }}
-        """
+# RT2: "After X you should Y." #After painting you should dry
+def _extract_after(head: str, tail: str) -> dict:
+    words = tail.split()
+    if len(words) < 4:
+        raise ValueError("Unknown MCSK format!")
+    return {"preceding_process": words[0].rstrip(","), "succeeding_process": words[3].rstrip(".")}
 
-    elif "participatesAtSomeTime" in expression:
-        # Similar parsing for RT3
-        process_name = expression.split("(")[1].split(")")[0]
-        machine_name = expression.split("(")[3].split(")")[0]
-        # Print statements for debugging
-        print(f"Extracted process name:  {process_name}")
-        print(f"Extracted machine name: {machine_name}")
-
-        # Correctly replacing spaces with underscores for valid IRIs
-        process_name_formatted = process_name.replace(' ', '_')
-        machine_name_formatted = machine_name.replace(' ', '_')
-        sparql_query = f"""
-
-        INSERT {{
-        ?y rdf:type <http://www.mcskg.enit.fr/{machine_name_formatted}>"> .
-        ?y <http://purl.obolibrary.org/obo/BFO_0000056> ?x .
-        }}
-         WHERE {{
-        ?x rdf:type <"http://www.mcskg.enit.fr/{process_name_formatted}">.
-        BIND(URI(CONCAT("http://www.mcskg.enit.fr/{machine_name_formatted}_", STRUUID())) AS ?y)
-        }}
-        """
 
-    elif "ispartOf" in expression:
-        # Extracting product and material names from the expression
-        product_name = expression.split("(")[1].split(")")[0]
-        material_name = expression.split("(")[3].split(")")[0]
-          # Print statements for debugging
-        print(f"Extracted product_name:  {product_name}")
-        print(f"Extracted  material_name: {material_name}")
-        # Replacing spaces with underscores for valid IRIs
-        product_name_formatted = product_name.replace(' ', '_')
-        material_name_formatted = material_name.replace(' ', '_')
-
-        # Constructing the SPARQL query
-        sparql_query = f"""
-        INSERT {{
-            ?y rdf:type <http://www.mcskg.enit.fr/{material_name_formatted}> .
-            ?y <https://spec.industrialontologies.org/ontology/core/Core/isOutputOf>?x .
-        }}
-        WHERE {{
-            <?x rdf:type <http://www.mcskg.enit.fr/{product_name_formatted}> .
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{material_name_formatted}_", STRUUID())) AS ?y)
-        }}
-        """
+# RT3: "X process involves Y machine." #The drying process involves a dryer machine
+def _extract_involves(head: str, tail: str) -> dict:
+    return {"process": _entity(head).removesuffix(" process"), "machine": _entity(tail)}
 
-    elif "isOutputOf" in expression and id == 5:
-        assembly_name = expression.split("(")[1].split(")")[0]
-        assembly_process_name = expression.split("(")[2].split(")")[0]
-          # Print statements for debugging
-        print(f"Extracted assembly_name:  {assembly_name}")
-        print(f"Extracted  material_name: {assembly_process_name}")
-        assembly_name_formatted = assembly_name.replace(' ', '_')
-        assembly_process_name_formatted = assembly_process_name.replace(' ', '_')
-
-        sparql_query = f"""
-        INSERT {{
-            ?y rdf:type <http://www.mcskg.enit.fr/{assembly_process_name_formatted}> .
-            ?x <https://spec.industrialontologies.org/ontology/core/Core/isOutputOf> ?y .
-        }}
-        WHERE {{
-          ?x  rdf:type <http://www.mcskg.enit.fr/{assembly_name_formatted}>  .
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{assembly_process_name_formatted}_", STRUUID())) AS ?y)
-        }}
-        """
-    elif "isInputOf" in expression:
-        assembly_name = expression.split("(")[1].split(")")[0]
-        component_name = expression.split("(")[3].split(")")[0]
-              # Print statements for debugging
-        print(f"Extracted assembly_name:  {assembly_name}")
-        print(f"Extracted  component_name: {component_name}")
-        assembly_name_formatted = assembly_name.replace(' ', '_')
-        component_name_formatted = component_name.replace(' ', '_')
-
-        sparql_query = f"""
-        INSERT {{
-            ?y rdf:type <http://www.mcskg.enit.fr/{component_name_formatted}> .
-            ?y <http://example.org/isInputOf> ?x .
-        }}
-        WHERE {{
-            ?x rdf:type <http://www.mcskg.enit.fr/{assembly_name_formatted}> .
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{component_name_formatted}_", STRUUID())) AS ?y)
-        }}
-        """
-    elif "partOf" in expression:
-        assembly_name = expression.split("(")[1].split(")")[0]
-        process1_name = expression.split("(")[3].split(")")[0]
-        process2_name = expression.split("(")[4].split("∧ ")[1]
-           # Print statements for debugging
-        print( expression.split("("))
-        print(f"Extracted assembly_name:  {assembly_name}")
-        print(f"Extracted process1_namee: {process1_name}")
-        print(f"Extracted process2_namee: {process2_name}")
-
-        assembly_name_formatted = assembly_name.replace(' ', '_')
-        process1_name_formatted = process1_name.replace(' ', '_')
-        process2_name_formatted = process2_name.replace(' ', '_')
-
-        # Print statements for debugging
-        print(f"Extracted assembly_name:  {assembly_name}")
-        print(f"Extracted  process1_name: {process1_name}")
-        print(f"Extracted  process2_name: {process2_name}")
-
-        sparql_query = f"""
-        INSERT {{
-            ?y rdf:type <http://www.mcskg.enit.fr/{process1_name_formatted}> .
-            ?z rdf:type <http://www.mcskg.enit.fr/{process2_name_formatted}> .
-            ?y <http://example.org/partOf> ?x.
-            ?z <http://example.org/partOf> ?x.
-        }}
-        WHERE {{
-            ?x rdf:type <http://www.mcskg.enit.fr/{assembly_name}> .
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{process1_name_formatted}_", STRUUID())) AS ?y)
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{process2_name_formatted}_", STRUUID())) AS ?z)
-        }}
-        """
 
-    elif "isOutputOf" in expression and id == 8:
-      # Print statements for debugging
-        component1_name= expression.split("(")[1].split(")")[0]
-        component2_name = expression.split("(")[2].split("∧ ")[1]
-        process1_name = expression.split("(")[3].split("∧ ")[1]
-        process2_name = expression.split("(")[5].split("∧ ")[1]
-
-        print( expression.split("("))
-        component1_name_formatted = component1_name.replace(' ', '_')
-        component2_name_formatted = component2_name.replace(' ', '_')
-        process1_name_formatted = process1_name.replace(' ', '_')
-        process2_name_formatted = process2_name.replace(' ', '_')
-
-
-        # Print statements for debugging
-        print(f"Extracted component1_name:  {component1_name_formatted }")
-        print(f"Extracted component2_name:  {component2_name_formatted }")
-        print(f"Extracted  process1_name: {process1_name_formatted}")
-        print(f"Extracted  process2_name: {process2_name_formatted}")
-
-        sparql_query = f"""
-        INSERT {{
-            ?p1 rdf:type <http://www.mcskg.enit.fr/{process1_name_formatted}> .
-            ?p2 rdf:type <http://www.mcskg.enit.fr/{process2_name_formatted}> .
-            ?y rdf:type <http://www.mcskg.enit.fr/{component2_name_formatted}> .
-            ?x rdf:type <http://www.mcskg.enit.fr/{component1_name_formatted}> .
-            ?y <http://example.org/isOutputOf> ?p1 .
-            ?x <http://example.org/isOutputOf> ?p2 .
-        }}
-        WHERE {{
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{process1_name_formatted}_", STRUUID())) AS ?p1)
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{process2_name_formatted}_", STRUUID())) AS ?p2)
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{component2_name_formatted}_", STRUUID())) AS ?y)
-            BIND(URI(CONCAT("http://www.mcskg.enit.fr/{component1_name_formatted}_", STRUUID())) AS ?x1)
-        }}
+# RT7: "Lego assembly includes process1 and process2."
+def _extract_includes(head: str, tail: str) -> dict:
+    process1_part, _, process2_part = tail.partition(" and ")
+    return {"assembly": _entity(head), "process1": _entity(process1_part), "process2": _entity(process2_part)}
+
+
+# RT8: "Component1 [Name] is produced by process [Process1] and Component2 [Name] is produced by process [Process2]."
+def _extract_produced_by(head: str, tail: str) -> dict:
+    # The second component starts after the first " and " following the trigger
+    process1_part, _, component2_part = tail.partition(" and ")
+    component2_part, _, process2_part = component2_part.partition(" is produced by ")
+    bindings = {
+        "component1": head.strip(),
+        "process1": process1_part.strip(),
+        "component2": component2_part.strip(),
+        "process2": process2_part.strip(),
+    }
+    if not all(bindings.values()):
+        raise ValueError("Unknown MCSK format!")
+    return bindings
+
+
+# Update patterns of the rule templates: the SPARQL update of each template is
+# built from it, with the class IRI of the entity bound to a slot in its place.
+IOF_IS_OUTPUT_OF = "https://spec.industrialontologies.org/ontology/core/Core/isOutputOf"
+BFO_PRECEDES = "http://purl.obolibrary.org/obo/BFO_0000063"
+BFO_PARTICIPATES_IN = "http://purl.obolibrary.org/obo/BFO_0000056"
+
+RT1_UPDATE = UpdatePattern(("x", "product"), [("y", "process")], [("x", IOF_IS_OUTPUT_OF, "y")])
+RT2_UPDATE = UpdatePattern(("x", "preceding_process"), [("y", "succeeding_process")], [("x", BFO_PRECEDES, "y")])
+RT3_UPDATE = UpdatePattern(("x", "process"), [("y", "machine")], [("y", BFO_PARTICIPATES_IN, "x")])
+RT4_UPDATE = UpdatePattern(("x", "product"), [("y", "material")], [("y", "http://example.org/partOf", "x")])
+RT5_UPDATE = UpdatePattern(("x", "assembly"), [("y", "assembly_process")], [("x", IOF_IS_OUTPUT_OF, "y")])
+RT6_UPDATE = UpdatePattern(("x", "assembly"), [("y", "component")], [("y", "http://example.org/isInputOf", "x")])
+RT7_UPDATE = UpdatePattern(("x", "assembly"), [("y", "process1"), ("z", "process2")],
+                           [("y", "http://example.org/partOf", "x"), ("z", "http://example.org/partOf", "x")])
+RT8_UPDATE = UpdatePattern(None, [("p1", "process1"), ("p2", "process2"), ("y", "component2"), ("x", "component1")],
+                           [("y", "http://example.org/isOutputOf", "p1"), ("x", "http://example.org/isOutputOf", "p2")])
+
+RT1 = register_template(RuleTemplate("∀x (product(x) → ∃y (process(y) ∧ isOutputOf(x, y)))", 1,
+                                     {"product": "product(x)", "process": "process(y)"}),
+                        "result", _extract_result, RT1_UPDATE)
+RT2 = register_template(RuleTemplate("∀x (process(x) → ∃y (process(y) ∧ precedes(x, y)))", 2,
+                                     {"preceding_process": "process(x)", "succeeding_process": "process(y)"}),
+                        "After", _extract_after, RT2_UPDATE)
+RT3 = register_template(RuleTemplate("∀x (process(x) → ∃y (machine(y) ∧ participatesAtSomeTime(y, x)))", 3,
+                                     {"process": "process(x)", "machine": "machine(y)"}),
+                        "involves", _extract_involves, RT3_UPDATE)
+RT4 = register_template(RuleTemplate("∀x (product(x) → ∃y (material(y) ∧ partOf(y, x)))", 4,
+                                     {"product": "product(x)", "material": "material(y)"}),
+                        "made of", subject_object("product", "material"), RT4_UPDATE)
+RT5 = register_template(RuleTemplate("∀x (assembly(x) → ∃y (assemblyProcess(y) ∧ isOutputOf(x, y)))", 5,
+                                     {"assembly": "assembly(x)", "assembly_process": "assemblyProcess(y)"}),
+                        "is output of", subject_object("assembly", "assembly_process"), RT5_UPDATE)
+RT6 = register_template(RuleTemplate("∀x (assembly(x) → ∃y (component(y) ∧ isInputOf(y, x)))", 6,
+                                     {"assembly": "assembly(x)", "component": "component(y)"}),
+                        "is the input of", subject_object("component", "assembly"), RT6_UPDATE)
+RT7 = register_template(RuleTemplate("∀x (assembly(x) → ∃y,z (picking(y) ∧ fixing(z) ∧ partOf(y, x) ∧ partOf(z, x)))", 7,
+                                     {"assembly": "assembly(x)", "process1": "picking(y)", "process2": "fixing(z)"}),
+                        "includes", _extract_includes, RT7_UPDATE)
+RT8 = register_template(RuleTemplate("∀x,y (component1(x) ∧ component2(y) ∧ process(p1) ∧ isOutputOf(y, p1) ∧ process(p2) ∧ isOutputOf(x, p2))", 8,
+                                     {"component1": "component1(x)", "component2": "component2(y)",
+                                      "process1": "process(p1)", "process2": "process(p2)"}),
+                        "is produced by", _extract_produced_by, RT8_UPDATE)
+
+
+#TemplateMatch Class: Represents the result of classifying an MCSK statement, i.e. the rule template and the position of its trigger phrase.
+class TemplateMatch:
+    __slots__ = ("template", "start", "end")
+
+    def __init__(self, template: RuleTemplate, start: int, end: int):
+        """Initialize the TemplateMatch class.
+
+        Args:
+        template (RuleTemplate): The rule template selected for the statement.
+        start (int): Offset of the trigger phrase in the statement.
+        end (int): Offset just past the trigger phrase.
         """
+        self.template = template
+        self.start = start
+        self.end = end
+
+
+def classify_statement(statement: str) -> TemplateMatch:
+    """Find the rule template of a statement and the offsets of its trigger phrase in one search."""
+    found = _TRIGGER_PATTERN.search(statement)
+    if found is None:
+        raise ValueError("Unknown MCSK format!")
+    # Most statements hold one trigger; later ones only win on priority
+    other = _TRIGGER_PATTERN.search(statement, found.start() + 1)
+    while other is not None:
+        if _TRIGGER_PRIORITY[other.group()] < _TRIGGER_PRIORITY[found.group()]:
+            found = other
+        other = _TRIGGER_PATTERN.search(statement, other.start() + 1)
+    return TemplateMatch(TEMPLATE_TRIGGERS[found.group()], found.start(), found.end())
+
 
+def determine_rule_template(mcsk: MCSK) -> RuleTemplate:
+    return classify_statement(mcsk.statement).template
+
+
+def SpecializeRule(RT: RuleTemplate, MCSK: MCSK, match: TemplateMatch = None) -> ConcreteRule:
+    statement = MCSK.statement
+    if match is not None and match.template is RT:
+        start, end = match.start, match.end
     else:
+        start = statement.find(RT.trigger)
+        if start < 0:
+            raise ValueError("Unknown MCSK format!")
+        end = start + len(RT.trigger)
+
+    # Everything before and after the trigger phrase
+    bindings = RT.extract(statement[:start], statement[end:])
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for slot, name in bindings.items():
+            logger.debug("Extracted %s: %s", slot, name)
+
+    values = tuple(normalize_name(bindings[slot]) for slot in RT.slots)
+    if not all(values):
+        raise ValueError("Unknown MCSK format!")
+    return ConcreteRule(RT.fill(values), RT.id, values)
+
+
+def generate_concrete_rule(mcsk_input: str) -> ConcreteRule:
+    mcsk = MCSK(mcsk_input)
+    with metrics.stage("classify"):
+        match = classify_statement(mcsk.statement)
+    with metrics.stage("specialize", match.template.id):
+        concrete_rule = SpecializeRule(match.template, mcsk, match)
+    metrics.count_rule(match.template.id)
+    return concrete_rule
+
+
+def bind_rule(concrete_rule: ConcreteRule) -> ConcreteRule:
+    """Return the rule with its template id and slot bindings, recovering them from the expression when missing.
+
+    Rules built from an expression alone (e.g. sent back by a client) are
+    matched against the registered templates by the shape of their formula.
+    """
+    if concrete_rule.bindings is not None:
+        return concrete_rule
+    template = TEMPLATE_REGISTRY.get(concrete_rule.id)
+    formula = concrete_rule.formula
+    # Without a template id, the first registered template of the same shape is used
+    for candidate in [template] if template is not None else TEMPLATE_REGISTRY.values():
+        try:
+            return ConcreteRule(concrete_rule.expression, candidate.id, candidate.bind(formula))
+        except ValueError:
+            continue
+    raise ValueError("Unknown Rule Type in Concrete Rule!")
+
+
+def rule_key(concrete_rule: ConcreteRule) -> str:
+    """Identify what a rule inserts: the update pattern of its template, with slots by position, and its slot bindings.
+
+    Rules of templates whose updates only differ in slot names (RT1 and RT5)
+    have the same key when they bind the same names. Every instance the
+    rule's update mints carries the key in its IRI, after the class IRI:
+    <class IRI>_<key>_<uuid>.
+    """
+    rule = bind_rule(concrete_rule)
+    template = TEMPLATE_REGISTRY.get(rule.id)
+    if template is None:
         raise ValueError("Unknown Rule Type in Concrete Rule!")
+    return template.rule_key(rule.bindings)
 
-    return sparql_query
\ No newline at end of file
+
+def generate_sparql_query(concrete_rule: ConcreteRule) -> str:
+    # The SPARQL update is filled directly from the slot bindings of the rule
+    with metrics.stage("sparql", concrete_rule.id):
+        concrete_rule = bind_rule(concrete_rule)
+        template = TEMPLATE_REGISTRY.get(concrete_rule.id)
+        if template is None:
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        return template.fill_sparql(concrete_rule.bindings)
+
+
+#GenerationResult Class: The immutable outcome of the pipeline for one MCSK statement, as stored in the cache.
+class GenerationResult(NamedTuple):
+    concrete_rule: ConcreteRule
+    sparql_query: str
+
+
+# Results of generate_rule_and_query keyed on the normalized statement.
+# MCSK_CACHE_SIZE bounds the number of entries, MCSK_CACHE_TTL their age in seconds.
+generation_cache = LRUCache(int(os.environ.get("MCSK_CACHE_SIZE", 10000)),
+                            float(os.environ.get("MCSK_CACHE_TTL", 0)) or None)
+metrics.register(metrics.CallbackMetric("mcsk_cache_hits_total", "Statements answered from the rule cache.",
+                                        "counter", lambda: generation_cache.hits))
+metrics.register(metrics.CallbackMetric("mcsk_cache_misses_total", "Statements missing from the rule cache.",
+                                        "counter", lambda: generation_cache.misses))
+metrics.register(metrics.CallbackMetric("mcsk_cache_evictions_total", "Entries evicted from the rule cache.",
+                                        "counter", lambda: generation_cache.evictions))
+metrics.register(metrics.CallbackMetric("mcsk_cache_entries", "Entries currently in the rule cache.",
+                                        "gauge", lambda: len(generation_cache)))
+
+
+# Version of the output that does not show in the templates themselves: the
+# slot extractors, name normalization and IRI minting. Bump it whenever one
+# of them changes the rule or query generated for some statement, so cached
+# results and manifests made by the old code are not reused.
+# 2: names are normalized and minted IRIs percent-escaped by names.py
+# 3: articles and final periods are dropped by names.normalize_name, for RT8 too
+# 4: minted IRIs carry the key of the rule that minted them
+OUTPUT_SCHEMA_VERSION = 4
+
+
+def template_version() -> str:
+    """Hash of OUTPUT_SCHEMA_VERSION, every registered rule template and its SPARQL update; it changes whenever their output can."""
+    digest = hashlib.sha256(f"{OUTPUT_SCHEMA_VERSION}\0".encode("utf-8"))
+    for template_id, template in sorted(TEMPLATE_REGISTRY.items()):
+        for part in (template_id, template.expression, template.slots, template.trigger, template.sparql):
+            digest.update(repr(part).encode("utf-8") + b"\0")
+    return digest.hexdigest()[:16]
+
+
+def _dump_result(result: GenerationResult) -> str:
+    rule = result.concrete_rule
+    return json.dumps([rule.expression, rule.id, rule.bindings, result.sparql_query])
+
+
+def _load_result(text: str) -> GenerationResult:
+    expression, template_id, bindings, sparql_query = json.loads(text)
+    return GenerationResult(ConcreteRule(expression, template_id, bindings), sparql_query)
+
+
+# Second cache level shared by all workers and kept across restarts, enabled by
+# MCSK_CACHE_PATH. Its entries are stamped with template_version().
+persistent_cache = None
+if os.environ.get("MCSK_CACHE_PATH"):
+    try:
+        persistent_cache = SQLiteCache(os.environ["MCSK_CACHE_PATH"], template_version(), _dump_result, _load_result)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Persistent cache %s unavailable, running without it: %s", os.environ["MCSK_CACHE_PATH"], e)
+if persistent_cache is not None:
+    metrics.register(metrics.CallbackMetric("mcsk_persistent_cache_hits_total", "Statements answered from the persistent cache.",
+                                            "counter", lambda: persistent_cache.hits))
+    metrics.register(metrics.CallbackMetric("mcsk_persistent_cache_misses_total", "Statements missing from the persistent cache.",
+                                            "counter", lambda: persistent_cache.misses))
+    metrics.register(metrics.CallbackMetric("mcsk_persistent_cache_errors_total", "Failed reads and writes of the persistent cache.",
+                                            "counter", lambda: persistent_cache.errors))
+
+
+def normalize_statement(mcsk_input: str) -> str:
+    if not isinstance(mcsk_input, str):
+        raise ValueError("MCSK statement must be a string")
+    return " ".join(mcsk_input.split())
+
+
+def cached_result(mcsk_input: str) -> GenerationResult:
+    """Return the result of a statement from the in-memory cache of this process, or None."""
+    return generation_cache.get(normalize_statement(mcsk_input))
+
+
+def cache_result(mcsk_input: str, result: GenerationResult):
+    """Store a result generated elsewhere, e.g. by a worker process, in the in-memory cache of this process."""
+    generation_cache.put(normalize_statement(mcsk_input), result)
+
+
+def generate_rule_and_query(mcsk_input: str) -> GenerationResult:
+    statement = normalize_statement(mcsk_input)
+    result = generation_cache.get(statement)
+    if result is None and persistent_cache is not None:
+        result = persistent_cache.get(statement)
+        if result is not None:
+            generation_cache.put(statement, result)
+    cached = result is not None
+    if not cached:
+        concrete_rule = generate_concrete_rule(statement)
+        result = GenerationResult(concrete_rule, generate_sparql_query(concrete_rule))
+        generation_cache.put(statement, result)
+        if persistent_cache is not None:
+            persistent_cache.put(statement, result)
+
+    records = _trace_records.get()
+    if records is not None:
+        records.append({
+            "mcsk_input": statement,
+            "rule_template": result.concrete_rule.id,
+            "slots": result.concrete_rule.slot_bindings(),
+            "cached": cached,
+        })
+    return result
+
+
+@contextlib.contextmanager
+def trace_slots():
+    """Collect the template and slots extracted for every statement generated in this context.
+
+    Yields the list the records are appended to. Tracing is per thread/task,
+    so concurrent requests do not see each other's records.
+    """
+    records = []
+    token = _trace_records.set(records)
+    try:
+        yield records
+    finally:
+        _trace_records.reset(token)
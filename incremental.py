@@ -0,0 +1,292 @@
+"""Incremental recompilation of a knowledge base when its MCSK corpus changes.
+
+A manifest records, per statement fingerprint (sha256 of the normalized
+statement), the rule the statement produced. Given a new revision of the
+corpus only the statements that are not in the manifest are generated,
+and the SPARQL delta is emitted: DELETE updates undoing the rules no
+statement produces any more, then INSERT updates for the rules that are
+new. Rebuild time grows with the size of the change, not of the corpus.
+
+    python incremental.py corpus.txt --manifest kb.manifest.json --output delta.ru
+
+A rule is identified by its effect, function.rule_key() (template update
+and slot values), so rewording a statement without changing its rule emits
+nothing, and a rule produced by several statements is only deleted once
+none of them is left. Statements that fail to generate are not recorded,
+so they are tried again with the next revision.
+
+Rules run in the order their effects first occur in the corpus, and each
+one matches the instances minted by the rules before it. Every instance
+carries the key of the rule that minted it in its IRI, which lets the delta
+give the same store as a rebuild from scratch:
+
+* Deleting a rule removes the instances it minted, with every triple they
+  take part in, and, transitively, the instances that rules further down
+  the corpus minted for them (see sparql_batch.compile_delete_batch).
+* A rule whose effect changes place relative to the others, e.g. because
+  the statement that first produced it was removed or moved, is deleted and
+  added again at its new place.
+* A new rule can mint instances of a class that a rule already in the
+  store, further down the corpus, reads. Such retained rules are applied
+  again, transitively, to the instances the delta mints only (see
+  sparql_batch.parametric_marked).
+* A new rule does not match the instances that retained rules further down
+  the corpus minted (see Delta.excluded).
+
+The manifest is stamped with function.template_version(). When the
+templates change, the rules in the store no longer match the current
+templates and cannot be undone, so the command refuses to run. Clear the
+store and run it with --rebuild, which ignores the manifest and emits
+every rule again.
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from batch import DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, generate_batch
+from function import ConcreteRule, normalize_statement, rule_key, template_version
+from sparql_batch import compile_batch, compile_delete_batch, rule_classes
+
+logger = logging.getLogger(__name__)
+
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.sha256(normalize_statement(statement).encode("utf-8")).hexdigest()
+
+
+#Manifest Class: The rules produced by each statement of the last compiled corpus revision.
+class Manifest:
+    def __init__(self, entries: dict = None, version: str = None):
+        """Initialize the Manifest class.
+
+        Args:
+        entries (dict): Maps the fingerprints of the statements that generated a rule to their ConcreteRule.
+        version (str): template_version() the rules were generated with.
+        """
+        self.entries = entries if entries is not None else {}
+        self.version = version if version is not None else template_version()
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        """Read a manifest; a missing file gives an empty one.
+
+        Raises ValueError when the manifest was built with other rule
+        templates: the store holds rules a delta can no longer undo.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != template_version():
+            raise ValueError(f"Manifest {path} was built with other rule templates; "
+                             f"clear the store and compile the corpus again with --rebuild")
+        entries = {key: ConcreteRule(entry[0], entry[1], entry[2]) for key, entry in data["entries"].items()}
+        return cls(entries, data["version"])
+
+    def save(self, path: str):
+        # Written next to the target and renamed, so a crash never leaves a truncated manifest
+        entries = {key: [rule.expression, rule.id, rule.bindings] for key, rule in self.entries.items()}
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "entries": entries}, f)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def rules(self) -> dict:
+        """The rule of each effect, keyed on function.rule_key(), in the order the effects first occur in the corpus."""
+        rules = {}
+        for rule in self.entries.values():
+            rules.setdefault(rule_key(rule), rule)
+        return rules
+
+
+#Delta Class: The rules to remove and to add to bring a store from one corpus revision to the next.
+class Delta:
+    __slots__ = ("removed", "cascaded", "added", "reapplied", "excluded", "manifest", "errors", "generated")
+
+    def __init__(self, removed: list, cascaded: list, added: list, reapplied: set, excluded: dict, manifest: Manifest,
+                 errors: list, generated: int):
+        """Initialize the Delta class.
+
+        Args:
+        removed (list): ConcreteRules no statement of the new revision produces, and those whose place among the others changed.
+        cascaded (list): Retained ConcreteRules, in corpus order, whose instances minted for removed instances are removed as well.
+        added (list): ConcreteRules to run, in corpus order: those the old revision did not produce, and retained ones applied again.
+        reapplied (set): Positions in ``added`` of the retained rules, which only match the instances the delta mints.
+        excluded (dict): Maps positions in ``added`` of new rules to the retained rules further down the corpus whose minted instances they must not match.
+        manifest (Manifest): The manifest of the new revision.
+        errors (list): (statement, error) of the new statements that could not be generated.
+        generated (int): Statements that had to be generated.
+        """
+        self.removed = removed
+        self.cascaded = cascaded
+        self.added = added
+        self.reapplied = reapplied
+        self.excluded = excluded
+        self.manifest = manifest
+        self.errors = errors
+        self.generated = generated
+
+    def updates(self) -> list:
+        """The SPARQL updates applying the delta: deletions first, then insertions."""
+        return compile_delete_batch(self.removed, self.cascaded) + compile_batch(self.added, self.reapplied, self.excluded)
+
+
+def _moved(old_rules: dict, new_rules: dict) -> set:
+    # Effects of both revisions that changed place relative to the others: the
+    # longest run of effects keeping their old order stays, the others move
+    rank = {effect: index for index, effect in enumerate(old_rules)}
+    kept = [effect for effect in new_rules if effect in rank]
+    # Longest increasing subsequence of the old ranks
+    tail_ranks = []
+    tail_positions = []
+    previous = []
+    for position, effect in enumerate(kept):
+        length = bisect.bisect_left(tail_ranks, rank[effect])
+        previous.append(tail_positions[length - 1] if length else None)
+        if length == len(tail_ranks):
+            tail_ranks.append(rank[effect])
+            tail_positions.append(position)
+        else:
+            tail_ranks[length] = rank[effect]
+            tail_positions[length] = position
+    staying = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        staying.add(kept[position])
+        position = previous[position]
+    return {effect for effect in kept if effect not in staying}
+
+
+def diff(manifest: Manifest, statements, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS) -> Delta:
+    """Compare a new corpus revision with the manifest of the previous one.
+
+    Only statements whose fingerprint is not in the manifest are generated.
+
+    Args:
+    manifest (Manifest): Manifest of the revision the store currently holds.
+    statements (iterable): The MCSK statements of the new revision.
+    batch_size (int): Statements per task of the process pool.
+    workers (int): Worker processes; 1 generates inline.
+    """
+    keys = {}
+    fresh = {}
+    for statement in statements:
+        if not statement.strip():
+            continue
+        key = fingerprint(statement)
+        if key not in keys:
+            keys[key] = None
+            if key not in manifest.entries:
+                fresh[key] = statement
+
+    generated = {}
+    errors = []
+    for key, item in zip(fresh, generate_batch(list(fresh.values()), batch_size, workers)):
+        if item.error is None:
+            generated[key] = item.concrete_rule
+        else:
+            errors.append((item.mcsk_input, item.error))
+    # In corpus order, so the rules below are emitted in the order a rebuild would run them
+    entries = {}
+    for key in keys:
+        rule = generated.get(key) or manifest.entries.get(key)
+        if rule is not None:
+            entries[key] = rule
+    new_manifest = Manifest(entries, manifest.version)
+
+    old_rules = manifest.rules()
+    new_rules = new_manifest.rules()
+    moved = _moved(old_rules, new_rules)
+    removed = [rule for effect, rule in old_rules.items() if effect not in new_rules or effect in moved]
+
+    # Retained rules further down lose what they minted for the removed instances
+    cascaded = []
+    affected = set()
+    for effect, rule in old_rules.items():
+        reads, writes = rule_classes(rule)
+        if effect not in new_rules or effect in moved:
+            affected |= writes
+        elif reads & affected:
+            cascaded.append(rule)
+            affected |= writes
+
+    # A retained rule runs again when an earlier rule of the delta writes a class it reads
+    added = []
+    reapplied = set()
+    signatures = []
+    written = set()
+    for effect, rule in new_rules.items():
+        reads, writes = rule_classes(rule)
+        retained = effect in old_rules and effect not in moved
+        position = None
+        if not retained or reads & written:
+            position = len(added)
+            if retained:
+                reapplied.add(position)
+            added.append(rule)
+            written |= writes
+        signatures.append((rule, position, retained, reads, writes))
+
+    # A new rule must not match the instances that retained rules further down
+    # the corpus minted in the store, which it would not see in a rebuild
+    excluded = {}
+    writers_below = {}
+    for rule, position, retained, reads, writes in reversed(signatures):
+        if position is not None and not retained:
+            later = [writer for iri in reads for writer in writers_below.get(iri, ())]
+            if later:
+                excluded[position] = later
+        if retained:
+            for iri in writes:
+                writers_below.setdefault(iri, []).append(rule)
+    return Delta(removed, cascaded, added, reapplied, excluded, new_manifest, errors, len(fresh))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emit the SPARQL delta between the last compiled corpus revision and a new one")
+    parser.add_argument("statements", help="file with one MCSK statement per line")
+    parser.add_argument("--manifest", required=True, help="manifest of the previous revision, updated in place")
+    parser.add_argument("--output", help="file the SPARQL update request is written to (standard output by default)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="report the delta without writing it or the manifest")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="ignore the manifest and emit every rule, for a store that was cleared")
+    args = parser.parse_args()
+
+    try:
+        manifest = Manifest() if args.rebuild else Manifest.load(args.manifest)
+    except ValueError as e:
+        sys.exit(str(e))
+    with open(args.statements, encoding="utf-8") as f:
+        delta = diff(manifest, f, workers=args.workers)
+    for statement, error in delta.errors:
+        logger.warning("Skipping %r: %s", statement, error)
+    print(f"{delta.generated} statements generated, {len(delta.removed)} rules removed, "
+          f"{len(delta.cascaded)} rules cut back, "
+          f"{len(delta.added) - len(delta.reapplied)} rules added, {len(delta.reapplied)} rules applied again, "
+          f"{len(delta.errors)} errors", file=sys.stderr)
+    if args.dry_run:
+        return
+
+    request = " ;\n".join(delta.updates())
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(request)
+    else:
+        sys.stdout.write(request)
+    delta.manifest.save(args.manifest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Closed-loop HTTP load test for /generate.
+
+Starts CLIENTS threads that each post batches of BATCH statements for
+DURATION seconds and reports requests/s, statements/s, latency percentiles
+and rejected (503) requests. Run it once against each server, e.g.:
+
+    python App.py                                  # Werkzeug dev server on :5000
+    python loadtest.py --url http://127.0.0.1:5000/generate
+
+    uvicorn asgi:app --port 8000                   # ASGI serving path
+    python loadtest.py --url http://127.0.0.1:8000/generate
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from corpus import synthetic_corpus
+
+
+def _client(url, bodies: list, deadline: float, results: list, lock: threading.Lock):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    latencies, statuses = [], {}
+    index = 0
+    while perf_counter() < deadline:
+        body = bodies[index % len(bodies)]
+        index += 1
+        start = perf_counter()
+        try:
+            connection.request("POST", parts.path or "/", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+            status = "connection error"
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(perf_counter() - start)
+    connection.close()
+    with lock:
+        results.append((latencies, statuses))
+
+
+def run(url: str, clients: int, batch: int, duration: float, seed: int = 0) -> dict:
+    # Every client cycles through its own pre-encoded request bodies
+    corpus = synthetic_corpus(clients * batch * 20, seed)
+    bodies = [json.dumps({"mcsk_inputs": corpus[start:start + batch]}).encode()
+              for start in range(0, len(corpus), batch)]
+    results, lock = [], threading.Lock()
+    deadline = perf_counter() + duration
+    threads = [threading.Thread(target=_client, args=(url, bodies[i::clients], deadline, results, lock))
+               for i in range(clients)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    statuses = {}
+    for _, client_statuses in results:
+        for status, count in client_statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    percentile = lambda fraction: latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000 if latencies else None
+    return {
+        "url": url,
+        "clients": clients,
+        "batch": batch,
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "statements_per_second": len(latencies) * batch / elapsed,
+        "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000/generate")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent connections")
+    parser.add_argument("--batch", type=int, default=10, help="statements per request")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    summary = run(args.url, args.clients, args.batch, args.duration, args.seed)
+    summary["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
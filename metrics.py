@@ -0,0 +1,243 @@
+"""Low-overhead pipeline instrumentation exposed in the Prometheus text format.
+
+Set MCSK_METRICS=0 (or call set_enabled(False)) to turn every hook into a no-op.
+"""
+import bisect
+import contextlib
+import os
+import threading
+from time import perf_counter
+
+ENABLED = os.environ.get("MCSK_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# Upper bounds in seconds; a statement usually spends a few microseconds per stage
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+
+
+def _format_labels(labelnames: tuple, labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+#Counter Class: A monotonically increasing value per label combination.
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        """Initialize the Counter class.
+
+        Args:
+        name (str): Metric name.
+        help (str): One-line description shown in the exposition.
+        labelnames (tuple): Names of the labels the counter is broken down by.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name + _format_labels(self.labelnames, labels), value
+
+    def snapshot(self) -> dict:
+        with _lock:
+            return dict(self._values)
+
+    def merge(self, values: dict):
+        with _lock:
+            for labels, value in values.items():
+                self._values[labels] = self._values.get(labels, 0) + value
+
+    def reset(self):
+        self._values = {}
+
+
+#Histogram Class: Counts observations in cumulative buckets per label combination, plus their sum and count.
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """Initialize the Histogram class.
+
+        Args:
+        name (str): Metric name.
+        help (str): One-line description shown in the exposition.
+        labelnames (tuple): Names of the labels the histogram is broken down by.
+        buckets (tuple): Sorted upper bounds of the buckets; +Inf is implicit.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self):
+        with _lock:
+            items = sorted((labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items())
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket" + _format_labels(self.labelnames, labels, f'le="{le}"'), cumulative
+            yield self.name + "_sum" + _format_labels(self.labelnames, labels), total
+            yield self.name + "_count" + _format_labels(self.labelnames, labels), count
+
+    def snapshot(self) -> dict:
+        with _lock:
+            return {labels: [list(entry[0]), entry[1], entry[2]] for labels, entry in self._values.items()}
+
+    def merge(self, values: dict):
+        with _lock:
+            for labels, (bucket_counts, total, count) in values.items():
+                entry = self._values.get(labels)
+                if entry is None:
+                    entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                entry[0] = [a + b for a, b in zip(entry[0], bucket_counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def reset(self):
+        self._values = {}
+
+
+#CallbackMetric Class: A metric whose samples are read from a callback at exposition time, e.g. cache counters.
+class CallbackMetric:
+    def __init__(self, name: str, help: str, type: str, callback):
+        """Initialize the CallbackMetric class.
+
+        Args:
+        name (str): Metric name.
+        help (str): One-line description shown in the exposition.
+        type (str): Prometheus metric type, "counter" or "gauge".
+        callback (callable): Returns the current value.
+        """
+        self.name = name
+        self.help = help
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        yield self.name, self.callback()
+
+
+STAGE_SECONDS = Histogram("mcsk_stage_seconds", "Time spent in each stage of the generation pipeline.", ("stage",))
+RULES = Counter("mcsk_rules_total", "Concrete rules generated per rule template.", ("template",))
+FAILURES = Counter("mcsk_failures_total", "Failed statements per rule template and pipeline stage.", ("template", "stage"))
+
+_metrics = [STAGE_SECONDS, RULES, FAILURES]
+_aggregated = [STAGE_SECONDS, RULES, FAILURES]
+
+
+def register(metric):
+    """Add a metric to the /metrics exposition."""
+    _metrics.append(metric)
+    return metric
+
+
+def set_enabled(enabled: bool):
+    global ENABLED
+    ENABLED = enabled
+
+
+def template_label(template_id) -> str:
+    return "unknown" if template_id is None else f"RT{template_id}"
+
+
+#_StageTimer Class: Times one pipeline stage and counts it as a failure when it raises.
+class _StageTimer:
+    __slots__ = ("stage", "template_id", "start")
+
+    def __init__(self, stage: str, template_id):
+        self.stage = stage
+        self.template_id = template_id
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(perf_counter() - self.start, self.stage)
+        if exc_type is not None:
+            FAILURES.inc(template_label(self.template_id), self.stage)
+        return False
+
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str, template_id: int = None):
+    """Time a pipeline stage: ``with metrics.stage("classify"): ...``.
+
+    Args:
+    name (str): Stage label, e.g. "classify", "specialize", "sparql", "serialize".
+    template_id (int): Rule template the stage works on, used to label failures.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _StageTimer(name, template_id)
+
+
+def count_rule(template_id: int):
+    if ENABLED:
+        RULES.inc(template_label(template_id))
+
+
+def snapshot() -> list:
+    """Return the pipeline metrics as plain data, e.g. to ship them back from a worker process."""
+    return [metric.snapshot() for metric in _aggregated]
+
+
+def merge(values: list):
+    for metric, metric_values in zip(_aggregated, values):
+        metric.merge(metric_values)
+
+
+def reset():
+    with _lock:
+        for metric in _aggregated:
+            metric.reset()
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for sample, value in metric.samples():
+            lines.append(f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,95 @@
+"""Shared normalization of entity names and minting of their IRIs.
+
+Entity names extracted from MCSK statements repeat heavily across a
+corpus, so every function here is memoized: a name is normalized, interned
+and turned into an IRI once, however many statements mention it.
+mint_iris() handles a whole batch at once. It collects the names not seen
+before and converts them with a few string operations over one joined
+buffer, not one call chain per name.
+"""
+import sys
+
+# Namespace of the classes and instances the SPARQL templates refer to
+MCSKG_NAMESPACE = "http://www.mcskg.enit.fr/"
+
+# Memo tables are dropped wholesale when they reach this size, like the re module's cache
+MEMO_SIZE = int(1e5)
+
+# Characters that may not appear in an IRI reference (RFC 3987, SPARQL IRIREF) are percent-encoded
+_IRI_ESCAPES = {code: f"%{code:02X}" for code in (*range(0x21), *b'<>"{}|^`\\')}
+_IRI_ESCAPES[ord(" ")] = "_"
+# Normalized names hold no whitespace but single spaces, so newlines can separate them in a batch buffer
+del _IRI_ESCAPES[ord("\n")]
+
+# Leading articles dropped from entity names
+_ARTICLES = frozenset(("a", "an", "the", "A", "An", "The"))
+
+_normalized = {}
+_local_names = {}
+_iris = {}
+
+
+def _clean(name: str) -> str:
+    words = name.rstrip().rstrip(".").split()
+    if len(words) > 1 and words[0] in _ARTICLES:
+        del words[0]
+    return " ".join(words)
+
+
+def normalize_name(name: str) -> str:
+    """Clean up an extracted entity name and intern it, so equal names share one string.
+
+    The whitespace is collapsed, and the final period and a leading article
+    are dropped, the same way whichever template extracted the name.
+    """
+    normalized = _normalized.get(name)
+    if normalized is None:
+        if len(_normalized) >= MEMO_SIZE:
+            _normalized.clear()
+        normalized = _normalized[name] = sys.intern(_clean(name))
+    return normalized
+
+
+def _mint(names):
+    # One join, translate and split for the whole batch instead of a call chain per name
+    if len(_iris) + len(names) > MEMO_SIZE:
+        _local_names.clear()
+        _iris.clear()
+    # Only the whitespace is normalized: a name is minted as it was bound, articles included
+    local_names = "\n".join(" ".join(name.split()) for name in names).translate(_IRI_ESCAPES).split("\n")
+    iris = []
+    for name, local_name in zip(names, local_names):
+        _local_names[name] = local_name = sys.intern(local_name)
+        _iris[name] = iri = sys.intern(MCSKG_NAMESPACE + local_name)
+        iris.append(iri)
+    return iris
+
+
+def iri_name(name: str) -> str:
+    """Local part of the IRI of an entity, e.g. "painted object" -> "painted_object"."""
+    local_name = _local_names.get(name)
+    if local_name is None:
+        local_name = _mint([name])[0][len(MCSKG_NAMESPACE):]
+    return local_name
+
+
+def class_iri(name: str) -> str:
+    """IRI of the class an entity name stands for, e.g. http://www.mcskg.enit.fr/painted_object."""
+    iri = _iris.get(name)
+    if iri is None:
+        iri = _mint([name])[0]
+    return iri
+
+
+def mint_iris(names) -> list:
+    """Return the class IRI of every name, minting each distinct new name once for the whole batch."""
+    names = list(names)
+    unique = list(dict.fromkeys(names))
+    fresh = [name for name in unique if name not in _iris]
+    if len(_iris) + len(fresh) > MEMO_SIZE:
+        # The memo is about to be dropped, so every name of the batch is minted again
+        fresh = unique
+    minted = dict(zip(fresh, _mint(fresh))) if fresh else {}
+    iris = _iris
+    # The batch's own results back up the memo in case another thread dropped it meanwhile
+    return [iris.get(name) or minted.get(name) or class_iri(name) for name in names]
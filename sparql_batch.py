@@ -0,0 +1,305 @@
+"""Compile many concrete rules into a few consolidated SPARQL updates.
+
+Every rule of a template shares the same update shape; only the class IRIs
+differ. Rules of one template are therefore merged into a single update
+whose class IRIs come from a VALUES block, one row per rule:
+
+    INSERT { ?y rdf:type ?slot_process . ?x iof:isOutputOf ?y . }
+    WHERE {
+        VALUES (?slot_product ?slot_process ?rule) { (<...painted_object> <...painting> "b575ab797d13b618") ... }
+        ?x rdf:type ?slot_product .
+        BIND(URI(CONCAT(STR(?slot_process), "_", ?rule, "_", STRUUID())) AS ?y)
+    }
+
+?rule is the rule's key (function.rule_key), which every instance it mints
+carries in its IRI; compile_delete_batch finds the instances by it.
+
+Equivalence with running the per-rule updates one after another:
+
+* For a single rule the VALUES block has one row, and binding the slot
+  variables to that row gives back exactly the per-rule update.
+* With several rows, the WHERE solutions are the union of the per-rule
+  solutions. STRUUID() is evaluated once per solution, so every rule
+  mints fresh instances for each matching ?x, as it would on its own.
+  Duplicate rows would give identical solutions that a store may merge,
+  so a rule listed twice is put in two strata and fires twice.
+* A merged update evaluates every row against the same graph, whereas
+  sequential execution lets a rule see what earlier rules inserted. The
+  templates only read rdf:type triples of their "where" classes and only
+  write rdf:type triples of their minted classes plus fresh-subject
+  relations, so the two orders can differ only when one rule reads a class
+  another rule of the same update writes. The compiler sorts the batch
+  into strata so that no rule in a stratum reads a class written by
+  another rule in it, and every rule lands in a later stratum than each
+  earlier rule it depends on (it reads what that rule writes) or must not
+  overtake (it writes what that rule reads). Within a stratum every rule
+  then sees the graph as it was before the stratum, which is also what it
+  would have seen sequentially. Strata are emitted in order.
+
+check_sparql_batch.py and tests/test_sparql_batch.py run both forms on
+rdflib and compare the graphs.
+"""
+from function import SPARQL_PREFIX, TEMPLATE_REGISTRY, bind_rule, rule_key
+from names import class_iri, mint_iris
+
+# Tags the instances minted by a batch compiled with reapplied rules, until the batch ends
+PENDING_MARK = "<urn:mcskg:pending>"
+CLEAR_PENDING_MARKS = f"DELETE WHERE {{ ?instance {PENDING_MARK} true }}"
+# Tags the instances a delete batch removes, with every triple they take part in
+REMOVED_MARK = "<urn:mcskg:removed>"
+DELETE_MARKED = [
+    f"DELETE {{ ?subject ?predicate ?instance }} WHERE {{ ?instance {REMOVED_MARK} true . ?subject ?predicate ?instance }}",
+    f"DELETE {{ ?instance ?predicate ?object }} WHERE {{ ?instance {REMOVED_MARK} true . ?instance ?predicate ?object }}",
+]
+
+_template_signatures = {}
+
+
+def _slot_class(slot: str) -> str:
+    # The class IRI of a slot in a parametric update, bound per rule
+    return f"?slot_{slot}"
+
+
+def _inserted(update) -> str:
+    # The triple patterns of an update's INSERT block
+    lines = [f"    ?{variable} rdf:type {_slot_class(slot)} .\n" for variable, slot in update.minted]
+    lines += [f"    ?{subject} <{predicate}> ?{object_} .\n" for subject, predicate, object_ in update.links]
+    return "".join(lines)
+
+
+def _matched(update) -> str:
+    # The triple pattern of an update's WHERE block matching the rule's class, if any
+    if update.match is None:
+        return ""
+    variable, slot = update.match
+    return f"    ?{variable} rdf:type {_slot_class(slot)} .\n"
+
+
+def _where(template, values: bool) -> str:
+    if not values:
+        return "WHERE {\n"
+    variables = " ".join(_slot_class(slot) for slot in template.slots) + " ?rule"
+    return f"WHERE {{\n    VALUES ({variables}) {{\n{{rows}}\n    }}\n"
+
+
+def parametric_sparql(template, values: bool = False, marked: bool = False, marked_only: bool = False,
+                      filters: str = "") -> str:
+    """The update of a template with the class IRIs of its slots as ?slot_<name> variables.
+
+    Minted IRIs start with the rule's key, bound to ?rule. With ``values``
+    a VALUES block binding them, with "{rows}" where its rows go, opens the
+    WHERE block. See parametric_marked() for ``marked`` and
+    ``marked_only``; ``filters`` is inserted right after the matched pattern.
+    """
+    update = template.update
+    inserted = _inserted(update)
+    if marked:
+        inserted += "".join(f"    ?{variable} {PENDING_MARK} true .\n" for variable, _ in update.minted)
+    where = _matched(update) + filters
+    if marked_only and update.match is not None:
+        where += f"    ?{update.match[0]} {PENDING_MARK} true .\n"
+    where += "".join(f'    BIND(URI(CONCAT(STR({_slot_class(slot)}), "_", ?rule, "_", STRUUID())) AS ?{variable})\n'
+                     for variable, slot in update.minted)
+    return f"{SPARQL_PREFIX}INSERT {{\n{inserted}}}\n{_where(template, values)}{where}}}\n"
+
+
+def _signature(template):
+    # (slots read in WHERE, slots written in INSERT) of a template, computed once
+    signature = _template_signatures.get(template.id)
+    if signature is None:
+        update = template.update
+        reads = frozenset([update.match[1]] if update.match else ())
+        writes = frozenset(slot for _, slot in update.minted)
+        signature = _template_signatures[template.id] = (reads, writes)
+    return signature
+
+
+def _template_of(rule):
+    template = TEMPLATE_REGISTRY.get(rule.id)
+    if template is None or template.update is None:
+        raise ValueError("Unknown Rule Type in Concrete Rule!")
+    return template
+
+
+def rule_classes(rule) -> tuple:
+    """(class IRIs the rule's update reads, class IRIs it writes)."""
+    return _rule_classes(bind_rule(rule))
+
+
+def _rule_classes(rule) -> tuple:
+    template = _template_of(rule)
+    read_slots, write_slots = _signature(template)
+    values = dict(zip(template.slots, rule.bindings))
+    return {class_iri(values[slot]) for slot in read_slots}, {class_iri(values[slot]) for slot in write_slots}
+
+
+def _strata(rules: list) -> list:
+    # The strata of stratify(), as (position in ``rules``, rule) pairs
+    last_writer_level = {}
+    last_reader_level = {}
+    last_copy_level = {}
+    strata = []
+    for position, rule in enumerate(rules):
+        rule = bind_rule(rule)
+        reads, writes = _rule_classes(rule)
+
+        # Repeated rows of a VALUES block give identical solutions, which some
+        # stores (rdflib among them) evaluate once; a repeated rule waits for
+        # the next stratum so it fires again, as it would on its own
+        copy = (rule.id, rule.bindings)
+        level = last_copy_level.get(copy, -1) + 1
+        for iri in reads:
+            level = max(level, last_writer_level.get(iri, -1) + 1)
+        for iri in writes:
+            level = max(level, last_reader_level.get(iri, -1) + 1)
+        for iri in reads:
+            last_reader_level[iri] = max(level, last_reader_level.get(iri, -1))
+        for iri in writes:
+            last_writer_level[iri] = max(level, last_writer_level.get(iri, -1))
+
+        last_copy_level[copy] = level
+
+        if level == len(strata):
+            strata.append([])
+        strata[level].append((position, rule))
+    return strata
+
+
+def stratify(rules: list) -> list:
+    """Split rules into strata in which no rule reads a class another rule of the stratum writes.
+
+    A rule is placed one stratum after the latest earlier rule that writes
+    a class it reads, that reads a class it writes, or that is the same
+    rule; otherwise it joins the first stratum. Rules keep their relative
+    order inside a stratum.
+    """
+    return [[rule for _, rule in stratum] for stratum in _strata(list(rules))]
+
+
+def _values_rows(template, rules: list) -> str:
+    # The IRIs of the whole batch are minted in one call, once per distinct name
+    width = len(template.slots)
+    iris = mint_iris(value for rule in rules for value in rule.bindings)
+    return "\n".join("        (<" + "> <".join(iris[index * width:(index + 1) * width]) + f'> "{template.rule_key(rule.bindings)}")'
+                     for index, rule in enumerate(rules))
+
+
+def _minted_filters(update) -> str:
+    # Keeps the minted instances whose IRI starts with their class and the rule's key
+    return "".join(f'    FILTER(STRSTARTS(STR(?{variable}), CONCAT(STR({_slot_class(slot)}), "_", ?rule, "_")))\n'
+                   for variable, slot in update.minted)
+
+
+def compile_template_update(template, rules: list, mark: bool = False, marked_only: bool = False, excluded: list = ()) -> str:
+    """One update applying every rule of ``template`` through a VALUES block.
+
+    See parametric_marked() for ``mark`` and ``marked_only``. ``excluded``
+    is only allowed for a single rule: it then does not match the instances
+    of its class that those rules minted.
+    """
+    filters = ""
+    if excluded:
+        [rule] = rules
+        [read_class] = _rule_classes(rule)[0]
+        match_variable = template.update.match[0]
+        filters = "".join(f'    FILTER(!STRSTARTS(STR(?{match_variable}), "{read_class}_{key}_"))\n'
+                          for key in dict.fromkeys(rule_key(other) for other in excluded))
+    sparql = parametric_sparql(template, True, mark, mark and marked_only, filters)
+    return sparql.replace("{rows}", _values_rows(template, rules), 1)
+
+
+def parametric_marked(template, marked_only: bool = False) -> str:
+    """The parametric update of a template that also tags the instances it mints with PENDING_MARK.
+
+    With ``marked_only`` it only matches tagged instances, i.e. the ones the
+    updates before it in the same batch minted. A rule whose update already
+    ran on the store is applied again this way to what new rules minted,
+    without minting a second set of instances for what it matched before.
+    The batch ends with CLEAR_PENDING_MARKS.
+    """
+    return parametric_sparql(template, marked=True, marked_only=marked_only)
+
+
+def parametric_cascade(template, values: bool = False) -> str:
+    """The update tagging with REMOVED_MARK what a template's update minted for instances tagged already.
+
+    Minted instances are told apart from those of other rules by the key
+    in their IRI. ``values`` is as for parametric_sparql().
+    """
+    update = template.update
+    if update.match is None:
+        raise ValueError(f"Rule template {template.id} does not match any instance")
+    marks = "".join(f"    ?{variable} {REMOVED_MARK} true .\n" for variable, _ in update.minted)
+    where = f"{_matched(update)}    ?{update.match[0]} {REMOVED_MARK} true .\n{_inserted(update)}{_minted_filters(update)}"
+    return f"{SPARQL_PREFIX}INSERT {{\n{marks}}}\n{_where(template, values)}{where}}}\n"
+
+
+def _mark_removed(rules: list) -> str:
+    # Tags every instance the rules minted, found by its class and the rule key its IRI starts with
+    rows = {}
+    for rule in rules:
+        template = _template_of(rule)
+        key = template.rule_key(rule.bindings)
+        values = dict(zip(template.slots, rule.bindings))
+        for _, slot in template.update.minted:
+            rows[f'        (<{class_iri(values[slot])}> "{key}")'] = None
+    return (f"{SPARQL_PREFIX}INSERT {{\n    ?instance {REMOVED_MARK} true .\n}}\n"
+            f"WHERE {{\n    VALUES (?class ?rule) {{\n" + "\n".join(rows) + "\n    }\n"
+            f"    ?instance rdf:type ?class .\n"
+            f'    FILTER(STRSTARTS(STR(?instance), CONCAT(STR(?class), "_", ?rule, "_")))\n}}\n')
+
+
+def compile_delete_batch(rules: list, cascaded: list = ()) -> list:
+    """Compile the updates that remove what the rules inserted.
+
+    The instances the rules minted are tagged by the key in their IRI,
+    then, stratum by stratum, the instances that the ``cascaded`` rules
+    minted for tagged instances; last, every triple a tagged instance takes
+    part in is deleted, links other rules attached to it included.
+
+    Args:
+    rules (list): The ConcreteRules to undo.
+    cascaded (list): ConcreteRules that stay, in the order they were executed, which may have matched what the undone rules minted.
+    """
+    rules = [bind_rule(rule) for rule in rules]
+    if not rules:
+        return []
+    updates = [_mark_removed(rules)]
+    for stratum in stratify(list(cascaded)):
+        by_template = {}
+        for rule in stratum:
+            by_template.setdefault(rule.id, []).append(rule)
+        for template_id, template_rules in by_template.items():
+            template = TEMPLATE_REGISTRY[template_id]
+            updates.append(parametric_cascade(template, True).replace("{rows}", _values_rows(template, template_rules), 1))
+    return updates + DELETE_MARKED
+
+
+def compile_batch(rules: list, reapplied=(), excluded: dict = None) -> list:
+    """Compile ConcreteRules into the consolidated updates that, run in order, equal running the rules in order.
+
+    Args:
+    rules (list): The ConcreteRules, in the order they would be executed.
+    reapplied (collection): Positions in ``rules`` of rules that already ran on the store; they only match instances the batch mints.
+    excluded (dict): Maps positions in ``rules`` to the rules whose minted instances the rule there must not match (see compile_template_update); such a rule gets an update of its own.
+    """
+    updates = []
+    mark = bool(reapplied)
+    excluded = excluded or {}
+    for stratum in _strata(list(rules)):
+        by_template = {}
+        for position, rule in stratum:
+            if position in excluded:
+                updates.append(compile_template_update(TEMPLATE_REGISTRY[rule.id], [rule], mark, position in reapplied, excluded[position]))
+                continue
+            by_template.setdefault((rule.id, position in reapplied), []).append(rule)
+        for (template_id, marked_only), template_rules in by_template.items():
+            updates.append(compile_template_update(TEMPLATE_REGISTRY[template_id], template_rules, mark, marked_only))
+    if mark:
+        updates.append(CLEAR_PENDING_MARKS)
+    return updates
+
+
+def compile_batch_request(rules: list) -> str:
+    """The consolidated updates of compile_batch as a single update request."""
+    return " ;\n".join(compile_batch(rules))
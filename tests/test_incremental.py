@@ -0,0 +1,116 @@
+"""Incremental deltas against rebuilds from scratch.
+
+Applying the delta between two corpus revisions to the store compiled from
+the first has to give the store compiled from the second.
+"""
+import re
+
+import pytest
+
+rdflib = pytest.importorskip("rdflib")
+from rdflib.compare import isomorphic
+
+from check_sparql_batch import STATEMENTS, seed_graph
+from corpus import synthetic_corpus
+from function import generate_concrete_rule
+from incremental import Manifest, diff
+from names import MCSKG_NAMESPACE
+
+BASE = synthetic_corpus(60, seed=1)
+EXTRA = synthetic_corpus(15, seed=9)
+
+_MINTED_PATTERN = re.compile(re.escape(MCSKG_NAMESPACE) + r"(.+_[0-9a-f]{16})_[0-9a-f-]{36}\Z")
+_MINTED_WITH = rdflib.URIRef("urn:test:minted-with")
+
+
+def _rules(statements):
+    rules = []
+    for statement in statements:
+        try:
+            rules.append(generate_concrete_rule(statement))
+        except ValueError:
+            continue
+    return rules
+
+
+def _apply(graph, delta):
+    for update in delta.updates():
+        graph.update(update)
+
+
+def _comparable(graph) -> rdflib.Graph:
+    # Minted IRIs differ between runs: they become blank nodes, which keep the
+    # class and the rule key of their IRI
+    nodes = {}
+
+    def term(node):
+        minted = _MINTED_PATTERN.match(str(node))
+        if minted is None:
+            return node
+        if node not in nodes:
+            nodes[node] = rdflib.BNode()
+            comparable.add((nodes[node], _MINTED_WITH, rdflib.Literal(minted.group(1))))
+        return nodes[node]
+    comparable = rdflib.Graph()
+    for subject, predicate, object_ in graph:
+        comparable.add((term(subject), predicate, term(object_)))
+    return comparable
+
+
+def check_delta(old: list, new: list):
+    """Compile ``old``, apply the delta to ``new`` and compare the store with a rebuild of ``new``."""
+    rules = _rules(old + new)
+    store = seed_graph(rules)
+    first = diff(Manifest(), old, workers=1)
+    _apply(store, first)
+    delta = diff(first.manifest, new, workers=1)
+    _apply(store, delta)
+
+    rebuilt = seed_graph(rules)
+    _apply(rebuilt, diff(Manifest(), new, workers=1))
+    assert len(store) == len(rebuilt)
+    assert isomorphic(_comparable(store), _comparable(rebuilt))
+    return delta
+
+
+@pytest.mark.parametrize("new", [BASE[:-15], BASE[15:], BASE[:20] + BASE[40:], BASE[::2]],
+                         ids=["tail", "head", "middle", "every-other"])
+def test_removals(new):
+    delta = check_delta(BASE, new)
+    assert delta.removed
+
+
+@pytest.mark.parametrize("new", [EXTRA + BASE, BASE[:30] + EXTRA + BASE[30:], BASE + EXTRA],
+                         ids=["head", "middle", "tail"])
+def test_insertions(new):
+    delta = check_delta(BASE, new)
+    assert len(delta.added) > len(delta.reapplied)
+
+
+def test_replacement():
+    check_delta(BASE, BASE[:20] + EXTRA[:8] + BASE[35:])
+
+
+def test_reordering():
+    delta = check_delta(BASE, BASE[30:] + BASE[:30])
+    assert delta.removed and delta.added
+
+
+def test_removed_rule_cascades():
+    # The rule minting painting instances goes: so do the dry and pack instances minted for them
+    delta = check_delta(STATEMENTS, STATEMENTS[1:])
+    assert [rule.expression for rule in delta.cascaded] == [rule.expression for rule in _rules(STATEMENTS[1:3])]
+
+
+def test_first_copy_removed():
+    # The rule of the removed statement stays, but now runs after the rules reading its output
+    old = STATEMENTS[:3] + ["The result of painting is the painted object"]
+    delta = check_delta(old, old[1:])
+    assert delta.removed == delta.added == _rules(old[:1])
+
+
+def test_unchanged_corpus_emits_nothing():
+    first = diff(Manifest(), BASE, workers=1)
+    delta = diff(first.manifest, BASE, workers=1)
+    assert delta.generated == 0
+    assert delta.updates() == []
@@ -0,0 +1,75 @@
+"""The consolidated updates of sparql_batch against one SPARQL update per rule, run on rdflib."""
+import pytest
+
+rdflib = pytest.importorskip("rdflib")
+
+from check_sparql_batch import STATEMENTS, canonical, seed_graph
+from corpus import synthetic_corpus
+from function import RuleTemplate, UpdatePattern, generate_concrete_rule, generate_sparql_query, register_template
+from sparql_batch import compile_batch, compile_delete_batch, rule_classes, stratify
+
+SYNTHETIC = synthetic_corpus(100, seed=0)
+
+CORPORA = {
+    "templates": STATEMENTS,
+    "synthetic": SYNTHETIC,
+    # Rules listed twice have to fire twice
+    "duplicates": SYNTHETIC[:40] + SYNTHETIC[:20],
+}
+
+
+@pytest.fixture(params=sorted(CORPORA))
+def rules(request):
+    return [generate_concrete_rule(statement) for statement in CORPORA[request.param]]
+
+
+def _per_rule(rules) -> rdflib.Graph:
+    graph = seed_graph(rules)
+    for rule in rules:
+        graph.update(generate_sparql_query(rule))
+    return graph
+
+
+def _batched(rules) -> rdflib.Graph:
+    graph = seed_graph(rules)
+    for update in compile_batch(rules):
+        graph.update(update)
+    return graph
+
+
+def test_batched_updates_equal_per_rule_updates(rules):
+    assert canonical(_batched(rules)) == canonical(_per_rule(rules))
+
+
+def test_delete_batch_restores_the_seed(rules):
+    seed = set(seed_graph(rules))
+    for graph in (_per_rule(rules), _batched(rules)):
+        for update in compile_delete_batch(rules):
+            graph.update(update)
+        assert set(graph) == seed
+
+
+def test_no_rule_reads_what_its_stratum_writes(rules):
+    for stratum in stratify(rules):
+        classes = [rule_classes(rule) for rule in stratum]
+        for index, (reads, _) in enumerate(classes):
+            for other, (_, writes) in enumerate(classes):
+                assert other == index or not reads & writes
+
+
+@pytest.mark.parametrize("update", [
+    UpdatePattern(("x", "product"), []),
+    UpdatePattern(("x", "color"), [("y", "material")], [("y", "http://example.org/partOf", "x")]),
+    UpdatePattern(("x", "product"), [("slot_y", "material")], [("slot_y", "http://example.org/partOf", "x")]),
+    UpdatePattern(("x", "product"), [("x", "material")], [("x", "http://example.org/partOf", "x")]),
+    UpdatePattern(("x", "product"), [("y", "material")], [("y", "partOf", "x")]),
+    UpdatePattern(("x", "product"), [("y", "material")], [("y", "http://example.org/partOf", "z")]),
+    UpdatePattern(("x", "product"), [("y", "material")]),
+], ids=["nothing-minted", "unknown-slot", "slot-variable", "duplicate-variable", "relative-predicate",
+        "undeclared-variable", "unlinked"])
+def test_malformed_update_patterns_are_refused(update):
+    template = RuleTemplate("∀x (product(x) → ∃y (material(y) ∧ partOf(y, x)))", None,
+                            {"product": "product(x)", "material": "material(y)"})
+    with pytest.raises(ValueError):
+        register_template(template, "is built from", None, update)
+    assert template.update is None
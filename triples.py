@@ -0,0 +1,189 @@
+"""Materialize the triples of concrete rules directly, without running SPARQL.
+
+Each rule template is a simple existential pattern: for every instance x of
+the class it reads, it mints fresh instances of the classes it writes and
+links them to x. Given the typed instances of a knowledge base, the triples
+the SPARQL update would insert can therefore be written out as N-Triples or
+Turtle and handed to the triple store's bulk loader:
+
+    python triples.py corpus.txt --instances instances.nt --format nt > inferred.nt
+
+Fresh instances get deterministic skolem IRIs (the rule's key, as in the
+SPARQL updates, then a hash of the key, the variable and the matched
+instance) in place of STRUUID(), so loading the same output twice does not
+duplicate anything. Rules are applied in order
+and each sees the instances minted by the rules before it, as sequential
+updates would; a rule never sees its own output.
+"""
+import argparse
+import hashlib
+import logging
+import re
+import sys
+
+from function import RDF_TYPE, TEMPLATE_REGISTRY, bind_rule, generate_concrete_rule
+from names import MCSKG_NAMESPACE, class_iri
+
+logger = logging.getLogger(__name__)
+
+_NTRIPLES_TYPE_PATTERN = re.compile(r"^\s*<([^>]*)>\s+<" + re.escape(RDF_TYPE) + r">\s+<([^>]*)>\s*\.\s*$")
+_LOCAL_NAME_PATTERN = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_\-]*\Z")
+
+# Term kinds of a triple plan
+_VARIABLE, _SLOT, _IRI = range(3)
+
+_plans = {}
+
+
+#TriplePlan Class: The triple patterns of a rule template, read once from its update pattern.
+class TriplePlan:
+    __slots__ = ("match", "minted", "patterns")
+
+    def __init__(self, match: tuple, minted: tuple, patterns: tuple):
+        """Initialize the TriplePlan class.
+
+        Args:
+        match (tuple): (variable, slot) of the instances the rule applies to, or None for a rule that fires once.
+        minted (tuple): (variable, slot) of every fresh instance.
+        patterns (tuple): The inserted triples as (kind, value) terms.
+        """
+        self.match = match
+        self.minted = minted
+        self.patterns = patterns
+
+
+def triple_plan(template) -> TriplePlan:
+    """Return the TriplePlan of a registered rule template, built from its update pattern the first time."""
+    plan = _plans.get(template.id)
+    if plan is not None:
+        return plan
+    update = template.update
+    if update is None:
+        raise ValueError("Unknown Rule Type in Concrete Rule!")
+    patterns = tuple(((_VARIABLE, variable), (_IRI, RDF_TYPE), (_SLOT, slot)) for variable, slot in update.minted)
+    patterns += tuple(((_VARIABLE, subject), (_IRI, predicate), (_VARIABLE, object_))
+                      for subject, predicate, object_ in update.links)
+    plan = _plans[template.id] = TriplePlan(update.match, update.minted, patterns)
+    return plan
+
+
+def skolem_iri(name: str, key: str, variable: str, instance: str) -> str:
+    """Deterministic IRI of the instance of ``name`` minted for ``variable`` when the rule with key ``key`` matches ``instance``."""
+    digest = hashlib.blake2b("\x1f".join((key, variable, instance or "")).encode("utf-8"), digest_size=16).hexdigest()
+    return f"{class_iri(name)}_{key}_{digest}"
+
+
+def materialize(rules, instances):
+    """Yield the (subject, predicate, object) IRIs the rules infer from the typed instances.
+
+    Args:
+    rules (iterable): The ConcreteRules, in the order their updates would run.
+    instances (iterable): (instance IRI, class IRI) pairs already in the knowledge base.
+    """
+    by_class = {}
+    for instance, class_ in instances:
+        by_class.setdefault(class_, []).append(instance)
+
+    for rule in rules:
+        rule = bind_rule(rule)
+        template = TEMPLATE_REGISTRY.get(rule.id)
+        if template is None:
+            raise ValueError("Unknown Rule Type in Concrete Rule!")
+        plan = triple_plan(template)
+        values = dict(zip(template.slots, rule.bindings))
+        key = template.rule_key(rule.bindings)
+        if plan.match is None:
+            matched = [None]
+        else:
+            # Copied, so the rule does not match the instances it mints itself
+            matched = list(by_class.get(class_iri(values[plan.match[1]]), ()))
+
+        for instance in matched:
+            variables = {} if plan.match is None else {plan.match[0]: instance}
+            for variable, slot in plan.minted:
+                variables[variable] = skolem_iri(values[slot], key, variable, instance)
+            for pattern in plan.patterns:
+                triple = tuple(variables[value] if kind == _VARIABLE else
+                               class_iri(values[value]) if kind == _SLOT else value
+                               for kind, value in pattern)
+                if triple[1] == RDF_TYPE:
+                    by_class.setdefault(triple[2], []).append(triple[0])
+                yield triple
+
+
+def read_instances(lines):
+    """Yield the (instance IRI, class IRI) pairs of the rdf:type triples in N-Triples lines; other lines are skipped."""
+    for line in lines:
+        match = _NTRIPLES_TYPE_PATTERN.match(line)
+        if match:
+            yield match.group(1), match.group(2)
+
+
+def write_ntriples(triples, out):
+    for subject, predicate, object_ in triples:
+        out.write(f"<{subject}> <{predicate}> <{object_}> .\n")
+
+
+def _turtle_term(iri: str) -> str:
+    if iri == RDF_TYPE:
+        return "a"
+    if iri.startswith(MCSKG_NAMESPACE) and _LOCAL_NAME_PATTERN.match(iri, len(MCSKG_NAMESPACE)):
+        return "mcskg:" + iri[len(MCSKG_NAMESPACE):]
+    return f"<{iri}>"
+
+
+def write_turtle(triples, out):
+    # Consecutive triples of a subject are written as one statement, which is
+    # how materialize() yields them, so the output stays streamable.
+    out.write(f"@prefix mcskg: <{MCSKG_NAMESPACE}> .\n\n")
+    subject = None
+    for triple_subject, predicate, object_ in triples:
+        if triple_subject == subject:
+            out.write(f" ;\n    {_turtle_term(predicate)} {_turtle_term(object_)}")
+            continue
+        if subject is not None:
+            out.write(" .\n")
+        subject = triple_subject
+        out.write(f"{_turtle_term(subject)} {_turtle_term(predicate)} {_turtle_term(object_)}")
+    if subject is not None:
+        out.write(" .\n")
+
+
+WRITERS = {"nt": write_ntriples, "ttl": write_turtle}
+
+
+def _rules(lines):
+    for line in lines:
+        statement = line.strip()
+        if not statement:
+            continue
+        try:
+            yield generate_concrete_rule(statement)
+        except ValueError as e:
+            logger.warning("Skipping %r: %s", statement, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the triples inferred by MCSK statements as N-Triples or Turtle")
+    parser.add_argument("statements", help="file with one MCSK statement per line")
+    parser.add_argument("--instances", help="N-Triples file whose rdf:type triples are the instances to start from")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="nt")
+    parser.add_argument("--output", help="output file (standard output by default)")
+    args = parser.parse_args()
+
+    with open(args.statements, encoding="utf-8") as f:
+        rules = list(_rules(f))
+    instances = []
+    if args.instances:
+        with open(args.instances, encoding="utf-8") as f:
+            instances = list(read_instances(f))
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        WRITERS[args.format](materialize(rules, instances), out)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Execution backends that apply generated rules to an RDF store in bulk.
+
+LocalTripleStore applies rules to an in-process rdflib graph, optionally
+loaded from and saved to a file. RemoteSparqlStore sends many rules as one
+combined SPARQL update per request over a pool of keep-alive connections.
+
+    python triplestore.py serve --port 3030 --path kb.ttl
+
+runs a local SPARQL update endpoint backed by LocalTripleStore that can
+stand in for a remote store. The graph is saved every --commit-interval
+seconds while updates arrive, and on shutdown.
+"""
+import argparse
+import http.client
+import logging
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from function import TEMPLATE_REGISTRY, bind_rule, generate_sparql_query
+from names import class_iri
+from sparql_batch import compile_batch, parametric_sparql
+
+try:
+    import rdflib
+    from rdflib.plugins.sparql import prepareUpdate
+except ImportError:  # rdflib is only needed by the embedded store
+    rdflib = None
+
+logger = logging.getLogger(__name__)
+
+
+#LocalTripleStore Class: An in-process RDF graph the generated rules are applied to, optionally backed by a file.
+class LocalTripleStore:
+    def __init__(self, path: str = None, format: str = None, graph=None):
+        """Initialize the LocalTripleStore class.
+
+        Args:
+        path (str): File the graph is loaded from (when it exists) and saved to on commit.
+        format (str): rdflib serialization format of the file, guessed from its extension by default.
+        graph (rdflib.Graph): Graph to use instead of a new in-memory one.
+        """
+        if rdflib is None:
+            raise ImportError("LocalTripleStore requires rdflib (pip install rdflib)")
+        self.path = path
+        self.format = format or (rdflib.util.guess_format(path) if path else None) or "turtle"
+        self.graph = graph if graph is not None else rdflib.Graph()
+        self._prepared = {}
+        if path and os.path.exists(path):
+            self.graph.parse(path, format=self.format)
+
+    def _prepare(self, template):
+        # Parsing SPARQL is by far the slowest step in rdflib, so it happens once per template
+        prepared = self._prepared.get(template.id)
+        if prepared is None:
+            prepared = self._prepared[template.id] = prepareUpdate(parametric_sparql(template))
+        return prepared
+
+    def apply(self, rules: list, commit: bool = True) -> list:
+        """Apply concrete rules in order and return the number of triples each one inserted.
+
+        Every update is prepared before the graph is touched, so a rule
+        that cannot be turned into SPARQL leaves the graph unchanged.
+
+        Args:
+        rules (list): The ConcreteRules to apply.
+        commit (bool): Save the graph to ``path`` once all rules are applied.
+        """
+        operations = []
+        for rule in rules:
+            rule = bind_rule(rule)
+            template = TEMPLATE_REGISTRY.get(rule.id)
+            if template is None or template.update is None:
+                raise ValueError("Unknown Rule Type in Concrete Rule!")
+            bindings = {f"slot_{slot}": rdflib.URIRef(class_iri(value)) for slot, value in zip(template.slots, rule.bindings)}
+            bindings["rule"] = rdflib.Literal(template.rule_key(rule.bindings))
+            operations.append((self._prepare(template), bindings))
+
+        counts = []
+        for prepared, bindings in operations:
+            size = len(self.graph)
+            self.graph.update(prepared, initBindings=bindings)
+            counts.append(len(self.graph) - size)
+        if commit:
+            self.commit()
+        return counts
+
+    def update(self, sparql: str):
+        """Run a SPARQL update text (possibly several operations separated by ';') on the graph."""
+        self.graph.update(sparql)
+
+    def commit(self):
+        if not self.path:
+            return
+        # Written next to the target and renamed, so readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            self.graph.serialize(temporary, format=self.format)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def __len__(self):
+        return len(self.graph)
+
+
+#RemoteSparqlStore Class: A SPARQL 1.1 update endpoint reached over a pool of keep-alive HTTP connections.
+class RemoteSparqlStore:
+    def __init__(self, endpoint: str, pool_size: int = 4, timeout: float = 60, headers: dict = None):
+        """Initialize the RemoteSparqlStore class.
+
+        Args:
+        endpoint (str): URL of the update endpoint, e.g. http://localhost:3030/ds/update.
+        pool_size (int): Maximum number of idle connections kept open.
+        timeout (float): Socket timeout in seconds.
+        headers (dict): Extra HTTP headers, e.g. Authorization.
+        """
+        parts = urlsplit(endpoint)
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = parts.path or "/"
+        if parts.query:
+            self._path += "?" + parts.query
+        self._timeout = timeout
+        self._headers = {"Content-Type": "application/sparql-update; charset=utf-8", **(headers or {})}
+        self._pool = queue.LifoQueue(pool_size)
+
+    @contextmanager
+    def _connection(self):
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._connection_class(self._host, self._port, timeout=self._timeout)
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def update(self, sparql: str):
+        """POST one SPARQL update request; raises RuntimeError when the endpoint rejects it."""
+        body = sparql.encode("utf-8")
+        with self._connection() as connection:
+            connection.request("POST", self._path, body, self._headers)
+            response = connection.getresponse()
+            content = response.read()
+        if not 200 <= response.status < 300:
+            raise RuntimeError(f"SPARQL update failed with {response.status}: {content[:500].decode('utf-8', 'replace')}")
+
+    def apply(self, rules: list, rules_per_request: int = 1000, consolidate: bool = True) -> list:
+        """Send the rules as combined updates of ``rules_per_request`` rules each, in order.
+
+        With ``consolidate`` the rules of each request are compiled into one
+        VALUES-parameterized update per template (see sparql_batch), so the
+        store parses and plans a handful of operations instead of one per
+        rule. The SPARQL protocol does not report how many triples an
+        update inserted, so the per-rule counts are None.
+
+        Args:
+        rules (list): The ConcreteRules to apply.
+        rules_per_request (int): Rules sent in one request.
+        consolidate (bool): Merge the rules of a request with sparql_batch.compile_batch.
+        """
+        rules = list(rules)
+        for start in range(0, len(rules), rules_per_request):
+            chunk = rules[start:start + rules_per_request]
+            queries = compile_batch(chunk) if consolidate else [generate_sparql_query(rule) for rule in chunk]
+            self.update(" ;\n".join(queries))
+        return [None] * len(rules)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def execute_rules(rules: list, store) -> list:
+    """Apply ConcreteRules to a LocalTripleStore or RemoteSparqlStore and return the per-rule insert counts."""
+    return store.apply(list(rules))
+
+
+def serve(store: LocalTripleStore, host: str = "127.0.0.1", port: int = 3030, commit_interval: float = 5.0):
+    """Serve ``store`` as a SPARQL 1.1 update endpoint (POST application/sparql-update or form "update=").
+
+    Saving rewrites the whole graph, so updates are committed at most every
+    ``commit_interval`` seconds and once more on shutdown, not after each
+    request; a bulk load would otherwise take quadratic time.
+
+    Args:
+    store (LocalTripleStore): The store the updates are applied to.
+    host (str): Address to listen on.
+    port (int): Port to listen on.
+    commit_interval (float): Seconds between commits of pending updates; 0 commits after every request.
+    """
+    lock = threading.Lock()
+    dirty = threading.Event()
+    stopped = threading.Event()
+
+    def commit():
+        with lock:
+            if dirty.is_set():
+                store.commit()
+                dirty.clear()
+
+    def commit_periodically():
+        while not stopped.wait(commit_interval):
+            try:
+                commit()
+            except Exception:
+                logger.exception("Could not save the graph to %s", store.path)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                body = parse_qs(body).get("update", [""])[0]
+            try:
+                with lock:
+                    store.update(body)
+                    dirty.set()
+                    if commit_interval <= 0:
+                        store.commit()
+                        dirty.clear()
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                self.send_response(400)
+                self.send_header("Content-Length", str(len(message)))
+                self.end_headers()
+                self.wfile.write(message)
+                return
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    if commit_interval > 0:
+        threading.Thread(target=commit_periodically, name="triplestore-commit", daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
+        commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SPARQL update endpoint backed by an rdflib graph")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3030)
+    parser.add_argument("--path", help="file the graph is loaded from and saved to")
+    parser.add_argument("--commit-interval", type=float, default=5.0,
+                        help="seconds between saves of the graph; 0 saves after every update")
+    args = parser.parse_args()
+    # Stopped by a service manager: unwind through serve() so pending updates are saved
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    serve(LocalTripleStore(args.path), args.host, args.port, args.commit_interval)
+
+
+if __name__ == '__main__':
+    main()